@@ -50,4 +50,7 @@ app.listen(PORT, () => {
   console.log(
     ` - http://localhost:${PORT}/api/v1/data/:surveyId/:levelId?page=1&limit=10&filter={"Age":{">":25}}`
   );
+  console.log(
+    ` - http://localhost:${PORT}/api/v1/data/:surveyId/:levelId?limit=10&after=<nextCursor>`
+  );
 });
@@ -21,6 +21,14 @@ exports.getMicrodata = async (req, res, next) => {
     const page = parseInt(req.query.page) || 1;
     const limit = parseInt(req.query.limit) || 100; // Default limit
     const offset = (page - 1) * limit;
+    // Keyset cursor (data_id of the last record of the previous page)
+    const after =
+      req.query.after !== undefined ? parseInt(req.query.after) : null;
+    if (after !== null && isNaN(after)) {
+      return res
+        .status(400)
+        .json({ message: "Invalid cursor provided in 'after' parameter." });
+    }
 
     // Filtering parameters (assuming JSON string in query param)
     let filters = {};
@@ -34,12 +42,13 @@ exports.getMicrodata = async (req, res, next) => {
       }
     }
 
-    const { data, totalCount } = await dataService.findMicrodata(
+    const { data, totalCount, nextCursor } = await dataService.findMicrodata(
       surveyId,
       levelId,
       limit,
       offset,
-      filters
+      filters,
+      after
     );
 
     if (data.length === 0) {
@@ -56,6 +65,7 @@ exports.getMicrodata = async (req, res, next) => {
       limit,
       totalCount,
       totalPages: Math.ceil(totalCount / limit),
+      nextCursor,
       data,
     });
   } catch (error) {
@@ -2,17 +2,90 @@
 
 const { query } = require("../db");
 
+/**
+ * Returns the relation to read microdata of a level from. Levels ingested with
+ * compact payloads (short keys, see payload_encoding.py) are read through the
+ * survey_data_decoded view, so payloads and filters use full variable names.
+ * @param {number} levelId - The ID of the survey level.
+ * @returns {Promise<string>} - "survey_data_decoded" or "survey_data".
+ */
+const payloadSource = async (levelId) => {
+  // to_jsonb() also works when the payload_dictionary column was never added
+  const { rows } = await query(
+    `SELECT COALESCE(to_jsonb(sl)->'payload_dictionary', 'null') <> 'null' AS compact
+     FROM survey_levels sl WHERE level_id = $1;`,
+    [levelId]
+  );
+  return rows[0] && rows[0].compact ? "survey_data_decoded" : "survey_data";
+};
+
+/**
+ * Looks up a row count from the statistics maintained by the ingestion pipeline
+ * (survey_level_stats / survey_value_counts).
+ * Supports no filters or a single equality filter on a tracked variable
+ * (one listed in survey_level_stats.filter_variables).
+ * @param {number} surveyId - The ID of the survey.
+ * @param {number} levelId - The ID of the survey level.
+ * @param {Object} filters - The filters of the request.
+ * @returns {Promise<number|null>} - The count, or null if it must be computed with COUNT(*).
+ */
+const lookupCount = async (surveyId, levelId, filters) => {
+  const keys = Object.keys(filters || {});
+
+  if (keys.length === 0) {
+    const { rows } = await query(
+      `SELECT row_count FROM survey_level_stats
+       WHERE survey_id = $1 AND level_id = $2;`,
+      [surveyId, levelId]
+    );
+    return rows[0] ? parseInt(rows[0].row_count) : null;
+  }
+
+  const value = filters[keys[0]];
+  if (keys.length !== 1 || (typeof value === "object" && value !== null)) {
+    return null;
+  }
+
+  // Values are stored as the text data_payload->>'NAME' returns. A value without a
+  // count row (e.g. 27 for a stored "27.0") falls back to COUNT(*), which matches
+  // rows exactly like the data query does.
+  const { rows } = await query(
+    `SELECT v.row_count
+     FROM survey_value_counts v
+     JOIN survey_level_stats s
+       ON s.survey_id = v.survey_id AND s.level_id = v.level_id
+      AND v.variable_name = ANY(s.filter_variables)
+     WHERE v.survey_id = $1 AND v.level_id = $2
+       AND v.variable_name = $3 AND v.value_text = $4;`,
+    [surveyId, levelId, keys[0].toUpperCase(), String(value)]
+  );
+  return rows[0] ? parseInt(rows[0].row_count) : null;
+};
+
+exports.lookupCount = lookupCount;
+
 /**
  * Fetches paginated and filterable microdata for a specific survey level.
+ * When afterId is given, keyset pagination (data_id > afterId) is used instead of
+ * OFFSET, so every page costs the same. Counts come from the ingestion statistics
+ * when possible and fall back to COUNT(*).
  * @param {number} surveyId - The ID of the survey.
  * @param {number} levelId - The ID of the survey level.
  * @param {number} limit - The maximum number of records to return.
- * @param {number} offset - The number of records to skip.
+ * @param {number} offset - The number of records to skip (ignored when afterId is given).
  * @param {Object} filters - An object containing key-value pairs for filtering data_payload.
  * Example: { "Age": { ">": 25 }, "Gender": "Male" }
- * @returns {Promise<{data: Array, totalCount: number}>} - An object containing the data and total count.
+ * @param {number|null} afterId - Keyset cursor: return records with data_id greater than this.
+ * @returns {Promise<{data: Array, totalCount: number, nextCursor: number|null}>} - The data, total count and next cursor.
  */
-exports.findMicrodata = async (surveyId, levelId, limit, offset, filters) => {
+exports.findMicrodata = async (
+  surveyId,
+  levelId,
+  limit,
+  offset,
+  filters,
+  afterId = null
+) => {
   let whereClauses = ["survey_id = $1", "level_id = $2"];
   let params = [surveyId, levelId];
   let paramIndex = 3; // Start index for dynamic filter parameters
@@ -81,34 +154,56 @@ exports.findMicrodata = async (surveyId, levelId, limit, offset, filters) => {
 
   const whereClause =
     whereClauses.length > 0 ? `WHERE ${whereClauses.join(" AND ")}` : "";
+  const source = await payloadSource(levelId);
+
+  // Parameters for count query are the same as data query, excluding paging
+  const countParams = params.slice();
 
   // Query for data
-  const dataSql = `
+  let dataSql;
+  if (afterId !== null && afterId !== undefined) {
+    dataSql = `
         SELECT data_id, unit_identifier, data_payload
-        FROM survey_data
+        FROM ${source}
+        ${whereClause} AND data_id > $${paramIndex}
+        ORDER BY data_id
+        LIMIT $${paramIndex + 1};
+    `;
+    params.push(afterId, limit);
+  } else {
+    dataSql = `
+        SELECT data_id, unit_identifier, data_payload
+        FROM ${source}
         ${whereClause}
         ORDER BY data_id
         LIMIT $${paramIndex} OFFSET $${paramIndex + 1};
     `;
-  params.push(limit, offset);
+    params.push(limit, offset);
+  }
 
   // Query for total count (without limit/offset)
   const countSql = `
         SELECT COUNT(*) AS total_count
-        FROM survey_data
+        FROM ${source}
         ${whereClause};
     `;
-  // Parameters for count query are the same as data query, excluding limit/offset
-  const countParams = params.slice(0, paramIndex - 1);
 
-  const [dataResult, countResult] = await Promise.all([
+  const [dataResult, storedCount] = await Promise.all([
     query(dataSql, params),
-    query(countSql, countParams),
+    lookupCount(surveyId, levelId, filters),
   ]);
 
-  const totalCount = parseInt(countResult.rows[0].total_count);
+  let totalCount = storedCount;
+  if (totalCount === null) {
+    const countResult = await query(countSql, countParams);
+    totalCount = parseInt(countResult.rows[0].total_count);
+  }
+
+  const rows = dataResult.rows;
+  const nextCursor =
+    rows.length === limit ? parseInt(rows[rows.length - 1].data_id) : null;
 
-  return { data: dataResult.rows, totalCount };
+  return { data: rows, totalCount, nextCursor };
 };
 
 /**
@@ -123,9 +218,10 @@ exports.findMicrodataByUnitIdentifier = async (
   levelId,
   unitIdentifier
 ) => {
+  const source = await payloadSource(levelId);
   const sql = `
         SELECT data_id, unit_identifier, data_payload
-        FROM survey_data
+        FROM ${source}
         WHERE survey_id = $1 AND level_id = $2 AND unit_identifier = $3;
     `;
   const { rows } = await query(sql, [surveyId, levelId, unitIdentifier]);
@@ -12,8 +12,9 @@ app.secret_key = 'your-secret-key-here'  # Change this in production
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'pdf', 'csv'}
-MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
+ALLOWED_EXTENSIONS = {'pdf', 'csv', 'gz', 'zip', 'zst'}
+CSV_EXTENSIONS = {'csv', 'gz', 'zip', 'zst'}  # Compressed microdata is ingested without unpacking
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 100 * 1024 * 1024))  # 100MB max file size (bytes)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
@@ -261,9 +262,9 @@ def upload_files():
             print(f"Invalid PDF file type: {pdf_file.filename}")
             return jsonify({'error': 'First file must be a PDF'}), 400
         
-        if not allowed_file(csv_file.filename, {'csv'}):
+        if not allowed_file(csv_file.filename, CSV_EXTENSIONS):
             print(f"Invalid CSV file type: {csv_file.filename}")
-            return jsonify({'error': 'Second file must be a CSV'}), 400
+            return jsonify({'error': 'Second file must be a CSV (optionally .gz, .zip or .zst compressed)'}), 400
         
         # Ensure upload folder exists
         ensure_upload_folder()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Bulk Export Engine
+Streams survey levels out of PostgreSQL with COPY TO STDOUT into CSV or Parquet,
+with optional variable projection, parallel data_id range splits and a versioned cache
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ultra_fast_microdata import get_db_connection
+from payload_encoding import PayloadDictionary
+from level_stats import LEVEL_STATS_TABLE, lookup_count
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+
+# Export Configuration
+EXPORT_CACHE_DIR = 'exports'
+EXPORT_WORKERS = 4  # Parallel data_id range splits
+MIN_ROWS_PER_WORKER = 100000  # Small levels are exported by a single worker
+PARQUET_BLOCK_SIZE = 8 * 1024 * 1024  # CSV bytes decoded per Parquet row group
+
+# Text accepted when converting exported values to Parquet numbers; anything
+# else (ingestion keeps unparseable numerics as strings) becomes null
+INTEGER_PATTERN = r'^[+-]?\d{1,18}$'
+NUMERIC_PATTERN = r'^[+-]?((\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|Infinity|NaN)$'
+
+def load_level_export_info(cur, survey_id, level_id):
+    """
+    Load the schema, payload dictionary and data version of a level.
+    Ingestion only appends, so the highest data_id identifies the data version;
+    it is read from the (survey_id, level_id, data_id) index without scanning the level.
+    """
+    cur.execute("""
+        SELECT variable_schema, to_jsonb(sl)->'payload_dictionary'
+        FROM survey_levels sl
+        WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id))
+    result = cur.fetchone()
+    if not result:
+        raise ValueError(f"No level {level_id} found for survey {survey_id}")
+    variable_schema, stored_dictionary = result
+
+    cur.execute("""
+        SELECT MAX(data_id) FROM survey_data
+        WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id))
+    max_id = cur.fetchone()[0]
+
+    return {
+        'variable_schema': variable_schema,
+        'payload_dictionary': PayloadDictionary.from_stored(stored_dictionary),
+        'max_id': max_id,
+        'version': str(max_id or 0)
+    }
+
+def load_level_extent(cur, survey_id, level_id):
+    """
+    Lowest data_id and row count of a level, needed only when an export is built.
+    The count comes from survey_level_stats when the level is tracked, else COUNT(*).
+    """
+    cur.execute("""
+        SELECT MIN(data_id) FROM survey_data
+        WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id))
+    min_id = cur.fetchone()[0]
+
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (LEVEL_STATS_TABLE,))
+    row_count = lookup_count(cur, survey_id, level_id) if cur.fetchone()[0] else None
+    if row_count is None:
+        cur.execute("""
+            SELECT COUNT(*) FROM survey_data
+            WHERE survey_id = %s AND level_id = %s;
+        """, (survey_id, level_id))
+        row_count = cur.fetchone()[0]
+    return min_id, row_count
+
+def resolve_projection(variable_schema, variables=None):
+    """Return the schema entries to export, validating requested variable names"""
+    if not variables:
+        return list(variable_schema)
+
+    by_name = {var_def['name'].upper(): var_def for var_def in variable_schema}
+    missing = [name for name in variables if name.upper() not in by_name]
+    if missing:
+        raise ValueError(f"Unknown variables for this level: {missing}")
+    return [by_name[name.upper()] for name in variables]
+
+def build_export_query(cur, survey_id, level_id, projection, payload_dictionary=None, id_range=None):
+    """Build the SELECT used inside COPY, reading compact payload keys directly when present"""
+    columns = ["data_id", "unit_identifier"]
+    params = []
+    for var_def in projection:
+        var_name = var_def['name'].upper()
+        if payload_dictionary is not None and var_name in payload_dictionary.codes:
+            # Compact rows use the short code, rows loaded in full form the name; only a
+            # row with neither key means the default (an explicit JSON null stays null)
+            code = payload_dictionary.codes[var_name]
+            default = payload_dictionary.template.get(var_name)
+            columns.append("CASE WHEN data_payload ? %s THEN data_payload->>%s "
+                           "WHEN data_payload ? %s THEN data_payload->>%s ELSE %s END AS "
+                           + quote_identifier(var_name))
+            params.extend([code, code, var_name, var_name, None if default is None else json.dumps(default)])
+        else:
+            columns.append("data_payload->>%s AS " + quote_identifier(var_name))
+            params.append(var_name)
+
+    where = "survey_id = %s AND level_id = %s"
+    params.extend([survey_id, level_id])
+    if id_range is not None:
+        where += " AND data_id BETWEEN %s AND %s"
+        params.extend(id_range)
+
+    query = f"SELECT {', '.join(columns)} FROM survey_data WHERE {where} ORDER BY data_id"
+    # COPY cannot take bind parameters, so inline them safely
+    return cur.mogrify(query, params).decode()
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def split_id_range(min_id, max_id, row_count, workers):
+    """Split [min_id, max_id] into contiguous data_id ranges, one per worker"""
+    if min_id is None:
+        return []
+    workers = max(1, min(workers, row_count // MIN_ROWS_PER_WORKER or 1))
+    step = (max_id - min_id) // workers + 1
+    return [
+        (start, min(start + step - 1, max_id))
+        for start in range(min_id, max_id + 1, step)
+    ]
+
+def copy_to_file(select_sql, output, header=True):
+    """Stream COPY output straight into a file object (constant memory)"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER {'true' if header else 'false'})",
+                output
+            )
+    finally:
+        conn.close()
+
+def parquet_schema(projection):
+    """Arrow schema of the exported columns, from variable_schema types"""
+    fields = [('data_id', pa.int64()), ('unit_identifier', pa.string())]
+    for var_def in projection:
+        if var_def['type'] == 'INTEGER':
+            fields.append((var_def['name'].upper(), pa.int64()))
+        elif var_def['type'] == 'NUMERIC':
+            fields.append((var_def['name'].upper(), pa.float64()))
+        else:
+            fields.append((var_def['name'].upper(), pa.string()))
+    return pa.schema(fields)
+
+def coerce_batch(batch, schema):
+    """
+    Convert a batch read with text columns to the export schema.
+    Values that are not valid numbers become null instead of failing the export.
+    """
+    columns = []
+    for field in schema:
+        column = batch.column(field.name)
+        if column.type != field.type and not pa.types.is_string(field.type):
+            pattern = INTEGER_PATTERN if pa.types.is_integer(field.type) else NUMERIC_PATTERN
+            valid = pc.match_substring_regex(column, pattern)
+            column = pc.if_else(valid, column, pa.scalar(None, pa.string()))
+        columns.append(pc.cast(column, field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+def copy_to_parquet(select_sql, output_path, projection):
+    """
+    Stream COPY output through an OS pipe into a Parquet writer.
+    The database writes CSV into the pipe from a thread while Arrow decodes it
+    block by block, so memory stays bounded by PARQUET_BLOCK_SIZE.
+    """
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    read_fd, write_fd = os.pipe()
+    copy_errors = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as writer:
+                copy_to_file(select_sql, writer)
+        except Exception as e:
+            copy_errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    schema = parquet_schema(projection)
+    # Payload values are read as text and converted per batch (see coerce_batch)
+    read_types = {field.name: pa.int64() if field.name == 'data_id' else pa.string() for field in schema}
+
+    writer = None
+    try:
+        with os.fdopen(read_fd, 'rb') as reader:
+            stream = pa_csv.open_csv(
+                reader,
+                read_options=pa_csv.ReadOptions(block_size=PARQUET_BLOCK_SIZE),
+                # COPY writes NULL as an unquoted empty field and '' as a quoted one
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=read_types, strings_can_be_null=True, quoted_strings_can_be_null=False
+                )
+            )
+            # Opened before the first batch, so an empty range still gets a file with the right schema
+            writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+            for batch in stream:
+                writer.write_batch(coerce_batch(batch, schema))
+    finally:
+        if writer is not None:
+            writer.close()
+        producer.join()
+
+    if copy_errors:
+        raise copy_errors[0]
+
+def export_part(select_sql, part_path, file_format, projection, header):
+    """Export one data_id range to a part file"""
+    if file_format == 'parquet':
+        copy_to_parquet(select_sql, part_path, projection)
+    else:
+        with open(part_path, 'wb') as output:
+            copy_to_file(select_sql, output, header=header)
+    return part_path
+
+def export_cache_path(survey_id, level_id, version, file_format, variables=None):
+    """Cache location keyed by survey, level, data version, format and projection"""
+    projection_key = 'all'
+    if variables:
+        projection_key = hashlib.sha1(','.join(sorted(v.upper() for v in variables)).encode()).hexdigest()[:12]
+    name = f"survey{survey_id}_level{level_id}_v{version}_{projection_key}.{file_format}"
+    return Path(EXPORT_CACHE_DIR) / name
+
+def export_level(survey_id, level_id, file_format='csv', variables=None, workers=EXPORT_WORKERS, use_cache=True):
+    """
+    Export a survey level to CSV or Parquet and return the output path.
+    Large levels are split into data_id ranges exported in parallel; CSV parts
+    are concatenated into one file, Parquet parts form a dataset directory.
+    """
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported export format: {file_format}")
+
+    start_time = time.time()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            info = load_level_export_info(cur, survey_id, level_id)
+            projection = resolve_projection(info['variable_schema'], variables)
+            output_path = export_cache_path(survey_id, level_id, info['version'], file_format, variables)
+
+            if use_cache and output_path.exists():
+                print(f"Using cached export: {output_path}")
+                return output_path
+
+            min_id, row_count = load_level_extent(cur, survey_id, level_id)
+            ranges = split_id_range(min_id, info['max_id'], row_count, workers) or [None]
+            queries = [
+                build_export_query(cur, survey_id, level_id, projection, info['payload_dictionary'], id_range)
+                for id_range in ranges
+            ]
+    finally:
+        conn.close()
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    staging_dir = output_path.with_name(output_path.name + f'.tmp{os.getpid()}')
+    staging_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        print(f"Exporting {row_count:,} rows with {len(queries)} worker(s)...")
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = [
+                executor.submit(
+                    export_part, query, staging_dir / f"part-{i:04d}.{file_format}",
+                    file_format, projection, i == 0
+                )
+                for i, query in enumerate(queries)
+            ]
+            parts = [future.result() for future in futures]
+
+        # Forced re-export over a multi-part Parquet directory: a non-empty
+        # directory cannot be replaced, so it is removed first
+        if output_path.is_dir():
+            shutil.rmtree(output_path)
+
+        if file_format == 'csv':
+            combined = staging_dir / 'combined.csv'
+            with open(combined, 'wb') as output:
+                for part in parts:
+                    with open(part, 'rb') as part_file:
+                        shutil.copyfileobj(part_file, output)
+                    part.unlink()
+            os.replace(combined, output_path)
+            shutil.rmtree(staging_dir)
+        elif len(parts) == 1:
+            os.replace(parts[0], output_path)
+            shutil.rmtree(staging_dir)
+        else:
+            if output_path.exists():
+                output_path.unlink()
+            os.replace(staging_dir, output_path)
+
+        with open(output_path.with_name(output_path.name + '.json'), 'w') as manifest:
+            json.dump({
+                'survey_id': survey_id,
+                'level_id': level_id,
+                'version': info['version'],
+                'format': file_format,
+                'variables': [var_def['name'].upper() for var_def in projection],
+                'rows': row_count,
+                'parts': len(parts),
+                'created_at': time.time()
+            }, manifest)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    elapsed = time.time() - start_time
+    speed = row_count / elapsed if elapsed > 0 else 0
+    print(f"Export completed in {elapsed:.2f}s ({speed:.0f} rows/sec): {output_path}")
+    return output_path
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python bulk_export.py <survey_id> <level_id> [csv|parquet] [VAR1,VAR2,...]")
+        sys.exit(1)
+    export_level(
+        int(sys.argv[1]),
+        int(sys.argv[2]),
+        sys.argv[3] if len(sys.argv) > 3 else 'csv',
+        sys.argv[4].split(',') if len(sys.argv) > 4 else None
+    )
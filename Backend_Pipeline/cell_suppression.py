@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Cell Suppression Engine
+Vectorized primary and complementary suppression for aggregated outputs
+(summary cube tabulations or any group-by result)
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+# Primary suppression rules
+MIN_CELL_COUNT = 3  # Cells built from fewer records than this are suppressed
+DOMINANCE_N = 1  # (n, k) dominance rule: the top n contributors...
+DOMINANCE_K = 0.85  # ...may not account for more than k of the cell total
+
+# Complementary suppression
+MAX_SECONDARY_PASSES = 50  # Safety limit on protect-the-margins iterations
+
+def primary_suppression(counts, totals=None, top_contributions=None,
+                        min_count=MIN_CELL_COUNT, dominance_k=DOMINANCE_K):
+    """
+    Flag cells that must be suppressed on their own merit.
+    counts: number of contributing records per cell
+    totals: cell totals of the published magnitude (optional)
+    top_contributions: sum of the top n contributors per cell (optional)
+    Returns a boolean array shaped like counts.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    mask = (counts > 0) & (counts < min_count)
+
+    if totals is not None and top_contributions is not None:
+        totals = np.abs(np.asarray(totals, dtype=np.float64))
+        top_contributions = np.abs(np.nan_to_num(np.asarray(top_contributions, dtype=np.float64)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dominant = (totals > 0) & (top_contributions > dominance_k * totals)
+        mask |= dominant
+
+    return mask
+
+def _lines(array, axis):
+    """View an N-dimensional array as a 2-D array of lines along one axis"""
+    return np.moveaxis(array, axis, -1).reshape(-1, array.shape[axis])
+
+def _open_line_cells(mask, axis):
+    """Unsuppressed cells lying on a line (along axis) that holds exactly one suppressed cell"""
+    single = np.broadcast_to(mask.sum(axis=axis, keepdims=True) == 1, mask.shape)
+    return single & ~mask
+
+def _unprotected_lines(values, mask, axis, preference=None):
+    """
+    View the table as lines along one axis and find the lines holding exactly
+    one suppressed cell, plus the best complementary cell for each line.
+    Cells with a higher preference win over smaller values, so a partner that
+    also protects a line of another axis is chosen first.
+    """
+    moved_shape = np.moveaxis(values, axis, -1).shape
+    line_values = _lines(values, axis)
+    line_mask = _lines(mask, axis)
+
+    needs_partner = line_mask.sum(axis=1) == 1
+    candidates = np.where(line_mask | (line_values == 0), np.inf, line_values)
+    key = candidates
+    if preference is not None and np.isfinite(candidates).any():
+        key = candidates - _lines(preference, axis) * (candidates[np.isfinite(candidates)].max() + 1)
+    partner = key.argmin(axis=1)
+    has_partner = np.isfinite(candidates[np.arange(len(partner)), partner])
+    return line_mask, moved_shape, needs_partner, partner, has_partner
+
+def complementary_suppression(values, primary_mask, max_passes=MAX_SECONDARY_PASSES):
+    """
+    Add secondary suppressions so no suppressed cell can be recovered from
+    the published margins. Every line (row, column, ... along every axis)
+    that has exactly one suppressed cell gets a non-suppressed cell suppressed
+    as well: preferably one whose lines along the other axes also need a
+    partner, otherwise the smallest non-zero one. All lines of an axis are
+    handled at once; passes repeat until nothing changes.
+    values: N-dimensional array of cell magnitudes (counts or totals)
+    Returns (mask, exposed) where exposed holds, per axis, the lines whose single
+    suppressed cell could not be protected, so their margin total must be withheld.
+    """
+    values = np.abs(np.nan_to_num(np.asarray(values, dtype=np.float64)))
+    mask = np.array(primary_mask, dtype=bool, copy=True)
+
+    for _ in range(max_passes):
+        changed = False
+        for axis in range(values.ndim):
+            # How many other axes' unprotected lines each candidate cell would also cover
+            preference = sum(
+                _open_line_cells(mask, other).astype(np.float64)
+                for other in range(values.ndim) if other != axis
+            ) if values.ndim > 1 else None
+            line_mask, moved_shape, needs_partner, partner, has_partner = \
+                _unprotected_lines(values, mask, axis, preference)
+            fix = np.flatnonzero(needs_partner & has_partner)
+            if fix.size:
+                line_mask[fix, partner[fix]] = True
+                mask = np.ascontiguousarray(np.moveaxis(line_mask.reshape(moved_shape), -1, axis))
+                changed = True
+        if not changed:
+            break
+
+    exposed = []
+    for axis in range(values.ndim):
+        _, moved_shape, needs_partner, _, has_partner = _unprotected_lines(values, mask, axis)
+        exposed.append((needs_partner & ~has_partner).reshape(moved_shape[:-1]))
+
+    return mask, exposed
+
+def suppress_table(values, counts, top_contributions=None,
+                   min_count=MIN_CELL_COUNT, dominance_k=DOMINANCE_K):
+    """
+    Run primary and complementary suppression over an N-dimensional table.
+    Returns (primary_mask, secondary_mask, exposed_margins).
+    """
+    primary = primary_suppression(counts, values, top_contributions, min_count, dominance_k)
+    combined, exposed = complementary_suppression(values, primary)
+    return primary, combined & ~primary, exposed
+
+def suppress_tabulation(table, row_dim, col_dim, value_column=None,
+                        count_column='cell_count', top_column='value_max',
+                        min_count=MIN_CELL_COUNT, dominance_k=DOMINANCE_K):
+    """
+    Apply suppression to a two-way tabulation such as summary_cubes.fetch_tabulation().
+    Cells are pivoted into a dense row_dim x col_dim grid, suppressed, and the
+    result is returned in long form with a 'suppression' column
+    ('', 'primary' or 'secondary') and the suppressed values blanked out.
+    Dominance is only applied when the top column is available (top-1 contributor).
+    value_column defaults to 'value_sum', or to count_column for count-only
+    tabulations (fetch_tabulation() with variable_name=''), whose sums are all zero.
+    Returns (result, withheld_margins): withheld_margins maps row_dim and col_dim
+    to the row/column labels whose margin totals must not be published, because
+    their single suppressed cell could not be protected by another cell.
+    """
+    count_only = 'value_count' not in table or not table['value_count'].fillna(0).any()
+    if value_column is None:
+        value_column = count_column if count_only else 'value_sum'
+
+    value_grid = table.pivot_table(index=row_dim, columns=col_dim, values=value_column,
+                                   aggfunc='sum', fill_value=0, dropna=False)
+    count_grid = table.pivot_table(index=row_dim, columns=col_dim, values=count_column,
+                                   aggfunc='sum', fill_value=0, dropna=False)
+    count_grid = count_grid.reindex_like(value_grid).fillna(0)
+
+    top_values = None
+    if top_column in table and DOMINANCE_N == 1 and value_column != count_column:
+        top_values = table.pivot_table(index=row_dim, columns=col_dim, values=top_column,
+                                       aggfunc='max', dropna=False).reindex_like(value_grid).to_numpy()
+
+    primary, secondary, exposed = suppress_table(
+        value_grid.to_numpy(), count_grid.to_numpy(), top_values, min_count, dominance_k
+    )
+    # Lines along axis 0 are columns, lines along axis 1 are rows
+    withheld_margins = {
+        row_dim: list(value_grid.index[exposed[1]]),
+        col_dim: list(value_grid.columns[exposed[0]])
+    }
+
+    status = np.full(primary.shape, '', dtype=object)
+    status[secondary] = 'secondary'
+    status[primary] = 'primary'
+    status_long = pd.DataFrame(status, index=value_grid.index, columns=value_grid.columns) \
+        .stack().rename('suppression').reset_index()
+
+    result = table.merge(status_long, on=[row_dim, col_dim], how='left')
+    result['suppression'] = result['suppression'].fillna('')
+    hidden = result['suppression'] != ''
+    for column in ['value_sum', 'value_sum_sq', 'value_max', 'mean', 'std', count_column, 'value_count']:
+        if column in result:
+            result[column] = result[column].astype('float64').mask(hidden)
+    return result, withheld_margins
+
+def check_count_tabulation():
+    """Regression check: count tables get secondary suppressions, not just withheld margins"""
+    table = pd.DataFrame({
+        'S': ['a', 'a', 'b', 'b', 'c', 'c'],
+        'I': ['x', 'y', 'x', 'y', 'x', 'y'],
+        'cell_count': [1, 10, 12, 9, 20, 15],
+        'value_count': [0] * 6,
+        'value_sum': [0.0] * 6,
+        'value_max': [None] * 6
+    })
+    result, withheld = suppress_tabulation(table, 'S', 'I')
+    status = result.set_index(['S', 'I'])['suppression']
+    assert status[('a', 'x')] == 'primary', status
+    assert (status == 'secondary').sum() == 3, status
+    assert withheld == {'S': [], 'I': []}, withheld
+    print("Count tabulation check passed")
+
+def benchmark(cell_counts=(100_000, 1_000_000), n_cols=50, seed=42):
+    """Time primary + complementary suppression on synthetic 2-D tables"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for n_cells in cell_counts:
+        n_rows = n_cells // n_cols
+        counts = rng.poisson(25, size=(n_rows, n_cols))
+        values = counts * rng.gamma(2.0, 500.0, size=(n_rows, n_cols))
+        top = values * rng.uniform(0.05, 0.86, size=(n_rows, n_cols))
+
+        start = time.time()
+        primary, secondary, _ = suppress_table(values, counts, top)
+        elapsed = time.time() - start
+
+        results.append({
+            'cells': n_rows * n_cols,
+            'seconds': elapsed,
+            'primary': int(primary.sum()),
+            'secondary': int(secondary.sum())
+        })
+        print(f"{n_rows * n_cols:>10,} cells: {elapsed:.3f}s "
+              f"({primary.sum():,} primary, {secondary.sum():,} secondary)")
+    return results
+
+if __name__ == "__main__":
+    check_count_tabulation()
+    benchmark()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Compressed Input Support
+Reads microdata straight out of .csv, .gz, .zip and .zst files as a stream,
+decoding the members of multi-member archives in parallel (one member per worker)
+"""
+
+import gzip
+import io
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:  # .zst input is optional
+    zstandard = None
+
+# Input Configuration
+INPUT_SUFFIXES = ('.csv', '.csv.gz', '.gz', '.zip', '.zst', '.csv.zst')
+DECODE_WORKERS = 4  # Archive members decoded at the same time
+PREFETCH_CHUNKS = 2  # Decoded chunks buffered per member (bounds memory)
+
+def is_supported_input(path):
+    name = Path(path).name.lower()
+    return any(name.endswith(suffix) for suffix in INPUT_SUFFIXES)
+
+def find_input_files(directory):
+    """All plain and compressed microdata files in a directory (case-insensitive suffixes)"""
+    return sorted(path for path in Path(directory).iterdir() if path.is_file() and is_supported_input(path))
+
+def list_input_sources(path):
+    """
+    Expand an input file into (source_name, opener) pairs.
+    Each opener returns a binary stream of CSV text; nothing is unpacked to disk.
+    """
+    path = Path(path)
+    name = path.name.lower()
+
+    if name.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.csv')
+            ]
+
+        def member_opener(member):
+            def open_member():
+                archive = zipfile.ZipFile(path)
+                stream = archive.open(member)
+                stream_close = stream.close
+
+                # Close the archive handle together with the member stream
+                def close():
+                    stream_close()
+                    archive.close()
+                stream.close = close
+                return stream
+            return open_member
+
+        return [(f"{path.name}:{member}", member_opener(member)) for member in members]
+
+    if name.endswith('.gz'):
+        return [(path.name, lambda: gzip.open(path, 'rb'))]
+
+    if name.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path.name} requires zstandard (pip install zstandard)")
+
+        def open_zst():
+            raw = open(path, 'rb')
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+            return io.BufferedReader(reader)
+        return [(path.name, open_zst)]
+
+    return [(path.name, lambda: open(path, 'rb'))]
+
+def _put(chunk_queue, item, stop_event):
+    """Put into a bounded queue unless the consumer has gone away; returns False if stopped"""
+    while not stop_event.is_set():
+        try:
+            chunk_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _decode_member(opener, read_csv_options, chunk_queue, stop_event):
+    """Worker: read one member chunk by chunk into its bounded queue"""
+    try:
+        with opener() as stream:
+            for chunk in pd.read_csv(stream, **read_csv_options):
+                if not _put(chunk_queue, chunk, stop_event):
+                    return
+        _put(chunk_queue, None, stop_event)
+    except Exception as e:
+        _put(chunk_queue, e, stop_event)
+
+def _drain(chunk_queue, stop_event):
+    """Consumer side of one member's queue"""
+    try:
+        while True:
+            item = chunk_queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Abandoned or failed: let the worker stop instead of blocking on a full queue
+        stop_event.set()
+
+def _failed_source(error):
+    """Chunk iterator of an input file that could not be opened: raises when consumed"""
+    raise error
+    yield
+
+def iter_input_chunks(paths, read_csv_options, workers=DECODE_WORKERS):
+    """
+    Yield (source_name, chunk_iterator) for every CSV stream in the given files, in order.
+    While one source is being consumed, the next ones are already decoded in the
+    background, so decompression and CSV parsing of archive members run in parallel.
+    A file that cannot be opened (corrupt archive, missing zstandard) is yielded as
+    one source whose iterator raises the error, so it fails on its own.
+    """
+    sources = []
+    for path in paths:
+        try:
+            sources.extend((source_name, opener, None) for source_name, opener in list_input_sources(path))
+        except Exception as e:
+            sources.append((Path(path).name, None, e))
+    if not sources:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources))))
+    streams = []
+    try:
+        # Submitted in order, so the source being consumed always has a running worker
+        for source_name, opener, error in sources:
+            chunk_queue = queue.Queue(maxsize=PREFETCH_CHUNKS)
+            stop_event = threading.Event()
+            if error is None:
+                executor.submit(_decode_member, opener, read_csv_options, chunk_queue, stop_event)
+            streams.append((source_name, chunk_queue, stop_event, error))
+
+        for source_name, chunk_queue, stop_event, error in streams:
+            if error is not None:
+                yield source_name, _failed_source(error)
+                continue
+            yield source_name, _drain(chunk_queue, stop_event)
+            stop_event.set()
+    finally:
+        for _, _, stop_event, _ in streams:
+            stop_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -10,7 +10,7 @@ class Config:
     # File Upload Configuration
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
-    ALLOWED_EXTENSIONS = {'pdf', 'csv'}
+    ALLOWED_EXTENSIONS = {'pdf', 'csv', 'gz', 'zip', 'zst'}
     
     # Database Configuration (for the existing scripts)
     DB_HOST = os.environ.get('DB_HOST', 'localhost')
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Data Quality Validation
+Vectorized per-chunk checks against variable_schema (type conformance, ranges,
+identifier completeness, duplicate unit identifiers) with per-column error
+counts and a sampled rejects file
+"""
+
+import csv
+import json
+import re
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Validation Configuration
+VALIDATION_REPORT_DIR = 'validation_reports'
+REJECT_SAMPLE_SIZE = 20  # Rejected values kept per column and check
+
+# Per-level value ranges {level_name: {variable: (min, max)}}. Variables not
+# listed here use "min"/"max" from their variable_schema entry, if present.
+VALUE_RANGES = {
+    # 'ASI_BLOCK_C': {'YR': (0, 99)},
+}
+
+CHECK_TYPE = 'type'
+CHECK_RANGE = 'range'
+CHECK_MISSING_ID = 'missing_identifier'
+CHECK_DUPLICATE_ID = 'duplicate_unit_identifier'
+
+def integer_id_text(numeric, stripped):
+    """
+    Text of INTEGER identifier values as int(float(x)) gives it in the transform:
+    truncated toward zero, any size. Values that do not convert (text, inf)
+    keep their raw text, like the transform's fallback.
+    """
+    finite = pd.Series(np.isfinite(numeric.to_numpy(dtype=np.float64)), index=numeric.index)
+    in_range = finite & (numeric.abs() < 2 ** 63)
+    if in_range.all():
+        return np.trunc(numeric).astype(np.int64).astype(str)
+    part = stripped.astype(object)
+    part[in_range] = np.trunc(numeric[in_range]).astype(np.int64).astype(str)
+    oversized = finite & ~in_range
+    if oversized.any():
+        part[oversized] = numeric[oversized].map(lambda v: str(int(v)))
+    return part
+
+class ChunkValidator:
+    """
+    Validates the raw (string) chunks of one file for one level.
+    Chunks must be validated in order (one worker) because duplicate
+    detection remembers the unit identifiers already seen.
+    """
+
+    def __init__(self, variable_schema, level_name, source_name):
+        self.source_name = source_name
+        self.level_name = level_name
+        self.variable_schema = variable_schema
+        self.common_ids = [var_def['name'].upper() for var_def in variable_schema if var_def['is_common_id']]
+        self.ranges = self._resolve_ranges()
+        self.rows_checked = 0
+        self.rows_rejected = 0
+        self.error_counts = {}
+        self.samples = []
+        self.sample_counts = {}
+        self.seen_unit_ids = set()
+        self.elapsed = 0.0
+
+    def _resolve_ranges(self):
+        configured = {name.upper(): bounds for name, bounds in VALUE_RANGES.get(self.level_name, {}).items()}
+        ranges = {}
+        for var_def in self.variable_schema:
+            var_name = var_def['name'].upper()
+            if var_name in configured:
+                ranges[var_name] = configured[var_name]
+            elif var_def.get('min') is not None or var_def.get('max') is not None:
+                ranges[var_name] = (var_def.get('min'), var_def.get('max'))
+        return ranges
+
+    def _record(self, column, check, failed, raw_values, row_offset):
+        """Count failures for a column/check and keep a few sample rejects"""
+        n_failed = int(failed.sum())
+        if n_failed == 0:
+            return
+        column_counts = self.error_counts.setdefault(column, {})
+        column_counts[check] = column_counts.get(check, 0) + n_failed
+
+        key = (column, check)
+        remaining = REJECT_SAMPLE_SIZE - self.sample_counts.get(key, 0)
+        if remaining <= 0:
+            return
+        positions = np.flatnonzero(failed)[:remaining]
+        for position in positions:
+            self.samples.append({
+                'source': self.source_name,
+                'row_number': row_offset + int(position) + 1,
+                'column': column,
+                'check': check,
+                'value': raw_values.iloc[position]
+            })
+        self.sample_counts[key] = self.sample_counts.get(key, 0) + len(positions)
+
+    def validate(self, columns, row_offset):
+        """
+        Validate one chunk, given as {UPPERCASE_COLUMN: Series of raw strings}.
+        row_offset is the number of data rows before this chunk in the file.
+        """
+        start = time.time()
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        rejected = np.zeros(n_rows, dtype=bool)
+        unit_id_parts = []
+
+        for var_def in self.variable_schema:
+            var_name = var_def['name'].upper()
+            mapped_type = var_def['type']
+            if var_name not in columns:
+                continue
+
+            raw = columns[var_name]
+            stripped = raw.str.strip()
+            present = stripped.notna() & (stripped != '')
+
+            numeric = None
+            if mapped_type in ('INTEGER', 'NUMERIC'):
+                numeric = pd.to_numeric(stripped.where(present), errors='coerce')
+                bad_type = present & numeric.isna()
+                if mapped_type == 'INTEGER':
+                    bad_type |= present & numeric.notna() & (numeric != np.floor(numeric))
+                self._record(var_name, CHECK_TYPE, bad_type.to_numpy(), raw, row_offset)
+                rejected |= bad_type.to_numpy()
+
+            if var_name in self.ranges and numeric is not None:
+                low, high = self.ranges[var_name]
+                out_of_range = pd.Series(False, index=raw.index)
+                if low is not None:
+                    out_of_range |= numeric < low
+                if high is not None:
+                    out_of_range |= numeric > high
+                self._record(var_name, CHECK_RANGE, out_of_range.to_numpy(), raw, row_offset)
+                rejected |= out_of_range.to_numpy()
+
+            if var_def['is_common_id']:
+                missing = ~present
+                self._record(var_name, CHECK_MISSING_ID, missing.to_numpy(), raw, row_offset)
+                rejected |= missing.to_numpy()
+                # Same normalisation as process_csv_chunk_optimized builds unit_identifier with
+                if numeric is not None and mapped_type == 'INTEGER':
+                    part = integer_id_text(numeric, stripped)
+                elif numeric is not None:
+                    part = numeric.map(lambda v: None if pd.isna(v) else str(float(v)))
+                else:
+                    part = stripped
+                unit_id_parts.append(part.where(present, None))
+
+        for var_name in self.common_ids:
+            if var_name not in columns:
+                self._record(var_name, CHECK_MISSING_ID, np.ones(n_rows, dtype=bool),
+                             pd.Series([None] * n_rows), row_offset)
+                rejected[:] = True
+
+        if unit_id_parts and len(unit_id_parts) == len(self.common_ids):
+            complete = np.logical_and.reduce([part.notna().to_numpy() for part in unit_id_parts])
+            joined = unit_id_parts[0].fillna('').astype(str)
+            for part in unit_id_parts[1:]:
+                joined = joined + '_' + part.fillna('').astype(str)
+            hashes = pd.util.hash_pandas_object(joined, index=False).to_numpy()
+
+            seen = self.seen_unit_ids
+            already_seen = np.fromiter((h in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+            duplicate = (pd.Series(hashes).duplicated().to_numpy() | already_seen) & complete
+            seen.update(hashes[complete].tolist())
+
+            self._record('UNIT_IDENTIFIER', CHECK_DUPLICATE_ID, duplicate, joined.reset_index(drop=True), row_offset)
+            rejected |= duplicate
+
+        self.rows_checked += n_rows
+        self.rows_rejected += int(rejected.sum())
+        self.elapsed += time.time() - start
+
+    def summary(self):
+        return {
+            'source': self.source_name,
+            'level': self.level_name,
+            'rows_checked': self.rows_checked,
+            'rows_with_errors': self.rows_rejected,
+            'error_counts': self.error_counts,
+            'validation_seconds': round(self.elapsed, 3)
+        }
+
+    def write_report(self, report_dir=VALIDATION_REPORT_DIR):
+        """Write the JSON summary and the sampled rejects CSV; returns the summary path"""
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        # Archive members are named "archive.zip:member.csv"; keep the report name filesystem-safe
+        stem = re.sub(r'[^\w.-]', '_', Path(self.source_name.replace(':', '_')).stem)
+
+        summary_path = report_dir / f"{stem}_validation.json"
+        with open(summary_path, 'w') as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+
+        with open(report_dir / f"{stem}_rejects.csv", 'w', newline='') as rejects_file:
+            writer = csv.DictWriter(rejects_file, fieldnames=['source', 'row_number', 'column', 'check', 'value'])
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+        return summary_path
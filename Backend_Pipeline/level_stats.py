@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Level Statistics
+Exact per-survey/level row counts and per-filter-variable value counts, kept up
+to date by ingestion so the API can answer counts with a lookup
+"""
+
+import json
+from collections import Counter
+from psycopg2.extras import execute_values
+from payload_encoding import payload_relation
+from summary_cubes import get_cube_dimensions
+
+LEVEL_STATS_TABLE = 'survey_level_stats'
+VALUE_COUNTS_TABLE = 'survey_value_counts'
+
+# Per-level filter variables whose value histograms are tracked. Levels not
+# listed here fall back to variables flagged "is_filter", and then to the
+# level's summary cube dimensions.
+FILTER_VARIABLES = {
+    # 'ASI_BLOCK_C': ['STATE_CODE', 'SECTOR'],
+}
+
+def get_filter_variables(level_name, variable_schema):
+    """Get the filter variables of a level (config, then schema flags, then cube dimensions)"""
+    if level_name in FILTER_VARIABLES:
+        return [name.upper() for name in FILTER_VARIABLES[level_name]]
+    flagged = [var_def['name'].upper() for var_def in variable_schema if var_def.get('is_filter')]
+    return flagged or get_cube_dimensions(level_name, variable_schema)
+
+def payload_text(value):
+    """Text form of a payload value, as returned by data_payload->>'NAME' in PostgreSQL"""
+    return value if isinstance(value, str) else json.dumps(value)
+
+class LevelStats:
+    """Row count and value histograms for the records of one level not yet written"""
+
+    def __init__(self, filter_variables):
+        self.filter_variables = list(filter_variables)
+        self.row_count = 0
+        self.value_counts = {var_name: Counter() for var_name in self.filter_variables}
+
+    @classmethod
+    def for_level(cls, level_name, variable_schema):
+        return cls(get_filter_variables(level_name, variable_schema))
+
+    def count_rows(self, n_rows):
+        """Add records that only need counting (levels without filter variables)"""
+        self.row_count += n_rows
+
+    def update(self, records_df):
+        """Add a DataFrame of processed records (vectorized value counts)"""
+        self.row_count += len(records_df)
+        for var_name in self.filter_variables:
+            if var_name not in records_df:
+                continue
+            counts = records_df[var_name].dropna().map(payload_text).value_counts()
+            self.value_counts[var_name].update(counts.to_dict())
+
+    def merge(self, other):
+        """Add the counts of another accumulator (e.g. one chunk) into this one"""
+        self.row_count += other.row_count
+        for var_name, counter in other.value_counts.items():
+            self.value_counts.setdefault(var_name, Counter()).update(counter)
+        return self
+
+    def reset(self):
+        self.row_count = 0
+        for counter in self.value_counts.values():
+            counter.clear()
+
+def ensure_level_stats_tables(cur):
+    """Create the statistics tables if they do not exist"""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LEVEL_STATS_TABLE} (
+            survey_id INTEGER NOT NULL,
+            level_id INTEGER NOT NULL,
+            row_count BIGINT NOT NULL DEFAULT 0,
+            filter_variables TEXT[] NOT NULL DEFAULT '{{}}',
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (survey_id, level_id)
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VALUE_COUNTS_TABLE} (
+            survey_id INTEGER NOT NULL,
+            level_id INTEGER NOT NULL,
+            variable_name TEXT NOT NULL,
+            value_text TEXT NOT NULL,
+            row_count BIGINT NOT NULL,
+            PRIMARY KEY (survey_id, level_id, variable_name, value_text)
+        );
+    """)
+    # Keyset pagination walks this index instead of skipping OFFSET rows
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS survey_data_level_data_id_idx
+        ON survey_data (survey_id, level_id, data_id);
+    """)
+
+def write_level_stats(cur, stats, survey_id, level_id):
+    """
+    Add the pending counts to the statistics tables in the current transaction
+    and reset the accumulator. Returns the number of rows counted.
+    """
+    if stats.row_count == 0:
+        return 0
+
+    cur.execute(f"""
+        INSERT INTO {LEVEL_STATS_TABLE} (survey_id, level_id, row_count, updated_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (survey_id, level_id) DO UPDATE SET
+            row_count = {LEVEL_STATS_TABLE}.row_count + EXCLUDED.row_count,
+            updated_at = now();
+    """, (survey_id, level_id, stats.row_count))
+
+    value_rows = [
+        (survey_id, level_id, var_name, value_text, count)
+        for var_name, counter in stats.value_counts.items()
+        for value_text, count in counter.items()
+    ]
+    if value_rows:
+        execute_values(cur, f"""
+            INSERT INTO {VALUE_COUNTS_TABLE} (survey_id, level_id, variable_name, value_text, row_count)
+            VALUES %s
+            ON CONFLICT (survey_id, level_id, variable_name, value_text) DO UPDATE SET
+                row_count = {VALUE_COUNTS_TABLE}.row_count + EXCLUDED.row_count;
+        """, value_rows, page_size=10000)
+
+    row_count = stats.row_count
+    stats.reset()
+    return row_count
+
+def rebuild_level_stats(cur, survey_id, level_id, filter_variables):
+    """Recount the statistics of a level from survey_data (backfill of rows loaded earlier)"""
+    filter_variables = [var_name.upper() for var_name in filter_variables]
+    cur.execute(f"DELETE FROM {LEVEL_STATS_TABLE} WHERE survey_id = %s AND level_id = %s;", (survey_id, level_id))
+    cur.execute(f"DELETE FROM {VALUE_COUNTS_TABLE} WHERE survey_id = %s AND level_id = %s;", (survey_id, level_id))
+    cur.execute(f"""
+        INSERT INTO {LEVEL_STATS_TABLE} (survey_id, level_id, row_count, filter_variables, updated_at)
+        SELECT %s, %s, COUNT(*), %s::text[], now()
+        FROM survey_data WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id, filter_variables, survey_id, level_id))
+    # Value counts are keyed by full variable names, so compact payloads are decoded first
+    source = payload_relation(cur, level_id)
+    for var_name in filter_variables:
+        cur.execute(f"""
+            INSERT INTO {VALUE_COUNTS_TABLE} (survey_id, level_id, variable_name, value_text, row_count)
+            SELECT %s, %s, %s, data_payload->>%s, COUNT(*)
+            FROM {source}
+            WHERE survey_id = %s AND level_id = %s AND data_payload->>%s IS NOT NULL
+            GROUP BY 4;
+        """, (survey_id, level_id, var_name, var_name, survey_id, level_id, var_name))
+
+def backfill_level_stats(cur, survey_id, level_id, filter_variables):
+    """
+    Rebuild a level's statistics before rows are added to it, when it has none yet
+    or tracks other filter variables than now. Afterwards the counts cover every
+    row of the level and can be kept up to date additively. Returns True if rebuilt.
+    """
+    cur.execute(f"""
+        SELECT filter_variables FROM {LEVEL_STATS_TABLE}
+        WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id))
+    result = cur.fetchone()
+    if result and sorted(result[0]) == sorted(var_name.upper() for var_name in filter_variables):
+        return False
+    rebuild_level_stats(cur, survey_id, level_id, filter_variables)
+    return True
+
+def lookup_count(cur, survey_id, level_id, filters=None):
+    """
+    Answer a row count from the statistics tables.
+    Supports no filter or a single equality filter on a tracked variable;
+    returns None when the count has to be computed from survey_data. A value
+    without a count row also returns None, so a filter value written in another
+    text form (27 vs 27.0) is counted the same way the data query matches it.
+    """
+    filters = filters or {}
+    if not filters:
+        cur.execute(f"""
+            SELECT row_count FROM {LEVEL_STATS_TABLE}
+            WHERE survey_id = %s AND level_id = %s;
+        """, (survey_id, level_id))
+        result = cur.fetchone()
+        return int(result[0]) if result else None
+
+    if len(filters) != 1:
+        return None
+    var_name, value = next(iter(filters.items()))
+    if isinstance(value, dict):
+        return None
+
+    cur.execute(f"""
+        SELECT v.row_count
+        FROM {VALUE_COUNTS_TABLE} v
+        JOIN {LEVEL_STATS_TABLE} s
+          ON s.survey_id = v.survey_id AND s.level_id = v.level_id
+         AND v.variable_name = ANY(s.filter_variables)
+        WHERE v.survey_id = %s AND v.level_id = %s AND v.variable_name = %s AND v.value_text = %s;
+    """, (survey_id, level_id, var_name.upper(), payload_text(value)))
+    result = cur.fetchone()
+    return int(result[0]) if result else None
+
+def fetch_microdata_page(cur, survey_id, level_id, after_data_id=0, limit=100):
+    """
+    Keyset pagination over survey_data: rows with data_id greater than the cursor.
+    Every page costs the same index range scan, unlike LIMIT/OFFSET.
+    Compact payloads are returned decoded.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    cur.execute(f"""
+        SELECT data_id, unit_identifier, data_payload
+        FROM {payload_relation(cur, level_id)}
+        WHERE survey_id = %s AND level_id = %s AND data_id > %s
+        ORDER BY data_id
+        LIMIT %s;
+    """, (survey_id, level_id, after_data_id, limit))
+    rows = cur.fetchall()
+    next_cursor = rows[-1][0] if len(rows) == limit else None
+    return rows, next_cursor
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Cross-Level Linkage Index
+Maps each unit's composite identifier (unit_identifier, built from the common
+identifiers) to an integer surrogate key, with the data_ids of the unit in
+every level, so blocks can be joined on integers
+"""
+
+from payload_encoding import payload_relation
+
+UNITS_TABLE = 'survey_units'
+UNIT_LEVELS_TABLE = 'survey_unit_levels'
+
+def ensure_linkage_tables(cur):
+    """Create the linkage tables if they do not exist"""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {UNITS_TABLE} (
+            unit_key BIGSERIAL PRIMARY KEY,
+            survey_id INTEGER NOT NULL,
+            unit_identifier TEXT NOT NULL,
+            UNIQUE (survey_id, unit_identifier)
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {UNIT_LEVELS_TABLE} (
+            level_id INTEGER NOT NULL,
+            data_id BIGINT NOT NULL,
+            unit_key BIGINT NOT NULL,
+            PRIMARY KEY (level_id, data_id)
+        );
+    """)
+    # Single-unit lookups and cross-level joins both go through unit_key
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS {UNIT_LEVELS_TABLE}_unit_key_idx
+        ON {UNIT_LEVELS_TABLE} (unit_key, level_id);
+    """)
+    # link_new_rows reads the rows above the watermark through this index
+    # (shared with keyset pagination in level_stats, whichever creates it first)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS survey_data_level_data_id_idx
+        ON survey_data (survey_id, level_id, data_id);
+    """)
+
+def link_new_rows(cur, survey_id, level_id):
+    """
+    Link the survey_data rows of a level that are not yet indexed (data_id above
+    the level's highest linked data_id). Runs in the caller's transaction, so
+    links are committed together with the rows. Returns the number of rows linked.
+    """
+    cur.execute(f"SELECT COALESCE(MAX(data_id), 0) FROM {UNIT_LEVELS_TABLE} WHERE level_id = %s;", (level_id,))
+    watermark = cur.fetchone()[0]
+
+    cur.execute(f"""
+        INSERT INTO {UNITS_TABLE} (survey_id, unit_identifier)
+        SELECT DISTINCT survey_id, unit_identifier
+        FROM survey_data
+        WHERE survey_id = %s AND level_id = %s AND data_id > %s
+        ON CONFLICT (survey_id, unit_identifier) DO NOTHING;
+    """, (survey_id, level_id, watermark))
+
+    cur.execute(f"""
+        INSERT INTO {UNIT_LEVELS_TABLE} (level_id, data_id, unit_key)
+        SELECT d.level_id, d.data_id, u.unit_key
+        FROM survey_data d
+        JOIN {UNITS_TABLE} u
+          ON u.survey_id = d.survey_id AND u.unit_identifier = d.unit_identifier
+        WHERE d.survey_id = %s AND d.level_id = %s AND d.data_id > %s
+        ON CONFLICT (level_id, data_id) DO NOTHING;
+    """, (survey_id, level_id, watermark))
+    return cur.rowcount
+
+def fetch_unit_record(cur, survey_id, unit_identifier):
+    """
+    Fetch one unit's rows across all levels with a single indexed lookup.
+    Returns {level_id: [data_payload, ...]} with compact payloads decoded.
+    """
+    cur.execute(f"""
+        SELECT d.level_id, d.data_payload
+        FROM {UNITS_TABLE} u
+        JOIN {UNIT_LEVELS_TABLE} l ON l.unit_key = u.unit_key
+        JOIN {payload_relation(cur)} d ON d.data_id = l.data_id
+        WHERE u.survey_id = %s AND u.unit_identifier = %s
+        ORDER BY d.level_id, d.data_id;
+    """, (survey_id, unit_identifier))
+
+    record = {}
+    for level_id, data_payload in cur.fetchall():
+        record.setdefault(level_id, []).append(data_payload)
+    return record
+
+def fetch_level_links(cur, level_a, level_b, limit=None):
+    """
+    Integer join of two levels through the linkage index.
+    Returns (unit_key, data_id_a, data_id_b) rows, to be joined to survey_data by data_id.
+    """
+    query = f"""
+        SELECT a.unit_key, a.data_id, b.data_id
+        FROM {UNIT_LEVELS_TABLE} a
+        JOIN {UNIT_LEVELS_TABLE} b ON b.unit_key = a.unit_key AND b.level_id = %s
+        WHERE a.level_id = %s
+        ORDER BY a.unit_key
+    """
+    params = [level_b, level_a]
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    cur.execute(query + ";", params)
+    return cur.fetchall()
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Load-Test Harness for the Pipeline Server
+Starts app.py locally (optionally against a throwaway PostgreSQL cluster), then
+measures status polling, concurrent large uploads and back-to-back pipeline starts.
+Results (p50/p95/p99 latency, throughput, server RSS) are saved as JSON.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = PIPELINE_DIR / 'load_test_results'
+
+# Default server: the Flask app as started by app.py, without the debug reloader
+DEFAULT_SERVER_CMD = (
+    f'"{sys.executable}" -c "import sys; sys.path.insert(0, r\'{PIPELINE_DIR}\'); '
+    'from app import app, ensure_upload_folder; ensure_upload_folder(); '
+    'app.run(host=\'127.0.0.1\', port={port}, debug=False, threaded=True)"'
+)
+
+CSV_ROW = b'"23","G","100004",0,0,0,0,0,0,-38402,0,0,0,0,0\n'
+CSV_COLUMNS = ['yr', 'blk', 'ag01'] + [f'g{i}' for i in range(1, 13)]
+PDF_BODY = b'%PDF-1.4\n% load test placeholder\n%%EOF\n'
+UPLOAD_LIMIT_MARGIN = 1024 * 1024  # Multipart overhead allowed on top of the CSV size
+
+# Tables the pipeline expects (normally created by the Data_Injection scripts),
+# seeded with the ASI 2023 survey and an ASI_BLOCK_C level matching CSV_ROW
+SCHEMA_SQL = """
+CREATE TABLE surveys (
+    survey_id SERIAL PRIMARY KEY,
+    survey_name TEXT NOT NULL,
+    survey_year INTEGER NOT NULL
+);
+CREATE TABLE survey_levels (
+    level_id SERIAL PRIMARY KEY,
+    survey_id INTEGER NOT NULL REFERENCES surveys (survey_id),
+    level_name TEXT NOT NULL,
+    variable_schema JSONB NOT NULL,
+    common_identifiers JSONB NOT NULL
+);
+CREATE TABLE survey_data (
+    data_id BIGSERIAL PRIMARY KEY,
+    survey_id INTEGER NOT NULL,
+    level_id INTEGER NOT NULL,
+    unit_identifier TEXT NOT NULL,
+    data_payload JSONB NOT NULL
+);
+INSERT INTO surveys (survey_name, survey_year) VALUES ('ASI', 2023);
+INSERT INTO survey_levels (survey_id, level_name, variable_schema, common_identifiers)
+VALUES (1, 'ASI_BLOCK_C', '{variable_schema}', '{common_identifiers}');
+"""
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def summarize(name, samples, wall_time, bytes_sent=0):
+    """Latency percentiles, throughput and status counts for one scenario"""
+    latencies = [latency for latency, _ in samples]
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    summary = {
+        'scenario': name,
+        'requests': len(samples),
+        'wall_seconds': round(wall_time, 3),
+        'throughput_rps': round(len(samples) / wall_time, 2) if wall_time > 0 else None,
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 50)),
+            'p95': _ms(percentile(latencies, 95)),
+            'p99': _ms(percentile(latencies, 99)),
+            'max': _ms(max(latencies) if latencies else None)
+        },
+        'status_counts': statuses
+    }
+    if bytes_sent:
+        summary['upload_mb_per_sec'] = round(bytes_sent / wall_time / 1024 / 1024, 2) if wall_time > 0 else None
+    print(f"{name}: {summary['requests']} requests, {summary['throughput_rps']} req/s, "
+          f"p50 {summary['latency_ms']['p50']}ms, p95 {summary['latency_ms']['p95']}ms, "
+          f"p99 {summary['latency_ms']['p99']}ms, statuses {statuses}")
+    return summary
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+class ThrowawayPostgres:
+    """Temporary PostgreSQL cluster (initdb + pg_ctl) with trust auth and the statathon database"""
+
+    def __init__(self, base_dir, db_name='statathon', user='postgres'):
+        self.data_dir = Path(base_dir) / 'pgdata'
+        self.socket_dir = Path(base_dir)
+        self.db_name = db_name
+        self.user = user
+        self.port = free_port()
+
+    @staticmethod
+    def available():
+        return all(shutil.which(tool) for tool in ('initdb', 'pg_ctl', 'createdb', 'psql'))
+
+    def start(self):
+        subprocess.run(['initdb', '-D', str(self.data_dir), '-U', self.user, '-A', 'trust'],
+                       check=True, capture_output=True)
+        subprocess.run([
+            'pg_ctl', '-D', str(self.data_dir), '-w', '-l', str(self.socket_dir / 'postgres.log'),
+            '-o', f"-p {self.port} -k {self.socket_dir} -c listen_addresses=localhost", 'start'
+        ], check=True, capture_output=True)
+        subprocess.run(['createdb', '-h', 'localhost', '-p', str(self.port), '-U', self.user, self.db_name],
+                       check=True, capture_output=True)
+        self.load_schema()
+        print(f"Throwaway PostgreSQL running on port {self.port}")
+
+    def load_schema(self):
+        """Create and seed the tables the pipeline reads, so ingestion runs against real tables"""
+        id_columns = ('yr', 'ag01')
+        variable_schema = [
+            {'name': name, 'type': 'NUMERIC' if name.startswith('g') else 'TEXT', 'is_common_id': name in id_columns}
+            for name in CSV_COLUMNS
+        ]
+        sql = SCHEMA_SQL.format(
+            variable_schema=json.dumps(variable_schema),
+            common_identifiers=json.dumps(list(id_columns))
+        )
+        subprocess.run(['psql', '-h', 'localhost', '-p', str(self.port), '-U', self.user, '-d', self.db_name,
+                        '-v', 'ON_ERROR_STOP=1', '-q'], input=sql.encode(), check=True, capture_output=True)
+
+    def stop(self):
+        subprocess.run(['pg_ctl', '-D', str(self.data_dir), '-m', 'fast', 'stop'], capture_output=True)
+
+    def env(self):
+        # ultra_fast_microdata.py reads DB_*; it connects without a port, so libpq picks up PGPORT
+        return {'PGPORT': str(self.port), 'DB_HOST': 'localhost', 'DB_NAME': self.db_name, 'DB_USER': self.user}
+
+class RssSampler(threading.Thread):
+    """Samples the resident set size of the server process tree"""
+
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def _rss_bytes(self, pid):
+        try:
+            with open(f'/proc/{pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            import psutil
+            return psutil.Process(pid).memory_info().rss
+        except Exception:
+            return None
+
+    def _tree_pids(self):
+        pids = [self.pid]
+        try:
+            children = Path(f'/proc/{self.pid}/task/{self.pid}/children').read_text().split()
+            pids.extend(int(child) for child in children)
+        except OSError:
+            pass
+        return pids
+
+    def run(self):
+        while not self._done.is_set():
+            values = [self._rss_bytes(pid) for pid in self._tree_pids()]
+            values = [value for value in values if value is not None]
+            if values:
+                self.samples.append(sum(values))
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def summary(self):
+        if not self.samples:
+            return {'available': False}
+        to_mb = lambda value: round(value / 1024 / 1024, 1)
+        return {
+            'available': True,
+            'start_mb': to_mb(self.samples[0]),
+            'peak_mb': to_mb(max(self.samples)),
+            'end_mb': to_mb(self.samples[-1])
+        }
+
+class Client:
+    """Minimal HTTP client (stdlib only) that keeps the Flask session cookie"""
+
+    def __init__(self, port, timeout=600):
+        self.port = port
+        self.timeout = timeout
+        self.cookie = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request; body may be bytes or an iterable of byte blocks. Returns (latency, status)."""
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            cookie = response.getheader('Set-Cookie')
+            if cookie:
+                self.cookie = cookie.split(';', 1)[0]
+            return time.perf_counter() - start, response.status
+        except (OSError, http.client.HTTPException) as e:
+            return time.perf_counter() - start, type(e).__name__
+        finally:
+            conn.close()
+
+def multipart_upload(csv_bytes):
+    """
+    Build a streamed multipart body with a small PDF and a synthetic CSV of
+    roughly csv_bytes bytes. Returns (headers, body_iterable, total_length).
+    """
+    boundary = uuid.uuid4().hex
+    # Unique per upload, so concurrent uploads do not write the same files in uploads/
+    pdf_name = f"load_test_{boundary[:12]}.pdf"
+    csv_name = f"load_test_{boundary[:12]}.csv"
+    rows = max(1, csv_bytes // len(CSV_ROW))
+    block_rows = 20000
+    head = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="pdf_file"; filename="{pdf_name}"\r\n'
+        'Content-Type: application/pdf\r\n\r\n'
+    ).encode() + PDF_BODY + (
+        f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="csv_file"; filename="{csv_name}"\r\n'
+        'Content-Type: text/csv\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    total_length = len(head) + rows * len(CSV_ROW) + len(tail)
+
+    def body():
+        yield head
+        remaining = rows
+        while remaining > 0:
+            count = min(block_rows, remaining)
+            yield CSV_ROW * count
+            remaining -= count
+        yield tail
+
+    headers = {
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(total_length)
+    }
+    return headers, body(), total_length
+
+def run_status_polling(port, clients, seconds):
+    """N clients polling /pipeline_status as fast as they can for a fixed time"""
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def poll():
+        client = Client(port, timeout=30)
+        local = []
+        while time.perf_counter() < deadline:
+            local.append(client.request('GET', '/pipeline_status'))
+        with lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in range(clients):
+            executor.submit(poll)
+    return summarize('status_polling', samples, time.perf_counter() - start)
+
+def run_uploads(port, uploads, upload_mb):
+    """Concurrent multipart uploads of large synthetic CSV files to /upload"""
+    def upload(_):
+        headers, body, length = multipart_upload(int(upload_mb * 1024 * 1024))
+        return Client(port).request('POST', '/upload', body=body, headers=headers), length
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=uploads) as executor:
+        results = list(executor.map(upload, range(uploads)))
+    wall_time = time.perf_counter() - start
+    samples = [sample for sample, _ in results]
+    return summarize('uploads', samples, wall_time, bytes_sent=sum(length for _, length in results))
+
+def run_pipeline_starts(port, starts):
+    """Back-to-back /start_pipeline calls from one session (after a small upload)"""
+    client = Client(port)
+    headers, body, _ = multipart_upload(64 * 1024)
+    client.request('POST', '/upload', body=body, headers=headers)
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(starts):
+        samples.append(client.request('POST', '/start_pipeline'))
+    return summarize('pipeline_starts', samples, time.perf_counter() - start)
+
+def prepare_server_dir(work_dir):
+    """
+    Lay out a scratch copy of the pipeline: server/ holds the Backend_Pipeline scripts
+    (ultra_fast_microdata.py runs from the app's working directory) and Data_Injection/
+    the metadata scripts, if they are found next to Backend_Pipeline.
+    Returns (server_dir, pipeline_scripts_found).
+    """
+    server_dir = work_dir / 'server'
+    server_dir.mkdir()
+    for script in PIPELINE_DIR.glob('*.py'):
+        shutil.copy2(script, server_dir / script.name)
+
+    injection_dir = work_dir / 'Data_Injection'
+    injection_dir.mkdir()
+    source_dir = PIPELINE_DIR.parent / 'Data_Injection'
+    scripts = sorted(source_dir.glob('*.py')) if source_dir.is_dir() else []
+    for script in scripts:
+        shutil.copy2(script, injection_dir / script.name)
+    return server_dir, bool(scripts)
+
+def stop_server(server):
+    """Stop the server and anything its shell started"""
+    if os.name == 'posix':
+        import signal
+        os.killpg(server.pid, signal.SIGTERM)
+    else:
+        server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+def wait_for_server(port, process, timeout=30):
+    deadline = time.time() + timeout
+    client = Client(port, timeout=2)
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited during startup with code {process.returncode}")
+        _, status = client.request('GET', '/health')
+        if status == 200:
+            return
+        time.sleep(0.25)
+    raise RuntimeError("Server did not become healthy in time")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the pipeline server endpoints")
+    parser.add_argument('--pollers', type=int, default=50, help="Concurrent /pipeline_status clients")
+    parser.add_argument('--poll-seconds', type=float, default=15, help="Duration of the polling scenario")
+    parser.add_argument('--uploads', type=int, default=4, help="Concurrent uploads")
+    parser.add_argument('--upload-mb', type=float, default=200, help="Size of each uploaded CSV in MB")
+    parser.add_argument('--pipeline-starts', type=int, default=20, help="Back-to-back /start_pipeline calls")
+    parser.add_argument('--server-cmd', default=DEFAULT_SERVER_CMD,
+                        help="Command that starts the server; {port} is substituted")
+    parser.add_argument('--label', default='flask-dev-threaded', help="Server mode label stored in the results")
+    parser.add_argument('--no-postgres', action='store_true', help="Do not start a throwaway PostgreSQL")
+    parser.add_argument('--output-dir', default=str(RESULTS_DIR))
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='pipeline_load_test_'))
+    # The app resolves uploads/ and ../Data_Injection from its working directory
+    server_dir, pipeline_scripts = prepare_server_dir(work_dir)
+    if not pipeline_scripts:
+        print("WARNING: Data_Injection scripts not found next to Backend_Pipeline; every /start_pipeline "
+              "run fails at the 'PDF to Metadata' step, so pipeline_starts only measures request handling")
+
+    postgres = None
+    server = None
+    sampler = None
+    env = dict(os.environ)
+    # Raise the app's upload limit (MAX_CONTENT_LENGTH) so the upload scenario measures real uploads
+    upload_limit = int(args.upload_mb * 1024 * 1024) + UPLOAD_LIMIT_MARGIN
+    env['MAX_CONTENT_LENGTH'] = str(max(upload_limit, int(env.get('MAX_CONTENT_LENGTH', 0))))
+    try:
+        if not args.no_postgres:
+            if ThrowawayPostgres.available():
+                postgres = ThrowawayPostgres(work_dir)
+                try:
+                    postgres.start()
+                    env.update(postgres.env())
+                except subprocess.CalledProcessError as e:
+                    # e.g. initdb refuses to run as root
+                    details = (e.stderr or b'').decode(errors='replace').strip()
+                    print(f"Could not start a throwaway PostgreSQL ({' '.join(map(str, e.cmd[:1]))}): {details}")
+                    print("Continuing without PostgreSQL (as with --no-postgres)")
+                    postgres.stop()
+                    postgres = None
+            else:
+                print("initdb/pg_ctl not found; running without a throwaway PostgreSQL")
+
+        port = free_port()
+        server = subprocess.Popen(
+            args.server_cmd.replace('{port}', str(port)), shell=True, cwd=server_dir, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=(os.name == 'posix')
+        )
+        wait_for_server(port, server)
+        sampler = RssSampler(server.pid)
+        sampler.start()
+        print(f"Server ready on port {port} ({args.label})")
+
+        scenarios = [
+            run_status_polling(port, args.pollers, args.poll_seconds),
+            run_uploads(port, args.uploads, args.upload_mb),
+            run_pipeline_starts(port, args.pipeline_starts)
+        ]
+        sampler.stop()
+
+        rejected = {status: count for status, count in scenarios[1]['status_counts'].items() if status != '200'}
+        if rejected:
+            print(f"WARNING: {sum(rejected.values())} of {args.uploads} uploads did not succeed ({rejected}); "
+                  f"check that the server honours MAX_CONTENT_LENGTH={env['MAX_CONTENT_LENGTH']}")
+
+        results = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'server_mode': args.label,
+            'server_cmd': args.server_cmd,
+            'postgres': postgres is not None,
+            'pipeline_scripts': pipeline_scripts,
+            'config': {
+                'pollers': args.pollers,
+                'poll_seconds': args.poll_seconds,
+                'uploads': args.uploads,
+                'upload_mb': args.upload_mb,
+                'max_content_length': int(env['MAX_CONTENT_LENGTH']),
+                'pipeline_starts': args.pipeline_starts
+            },
+            'server_rss': sampler.summary(),
+            'scenarios': scenarios
+        }
+
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / f"load_test_{args.label}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output_path, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Server RSS: {results['server_rss']}")
+        print(f"Results saved to {output_path}")
+    finally:
+        if sampler is not None and sampler.is_alive():
+            sampler.stop()
+        if server is not None and server.poll() is None:
+            stop_server(server)
+        if postgres is not None:
+            postgres.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Compact Payload Encoding
+Short-key dictionary per survey level so data_payload stores short codes instead
+of full variable names, and drops nulls and default values
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+NUMERIC_TYPES = ('INTEGER', 'NUMERIC')
+DECODED_VIEW = 'survey_data_decoded'
+CODE_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+# Per-level default value for numeric variables. Numeric cells equal to the
+# default are dropped from the compact payload and restored on decode; nulls of
+# these variables are kept as explicit JSON nulls so they do not decode as the default.
+PAYLOAD_DEFAULT_VALUES = {
+    'ASI_BLOCK_G': 0,
+}
+
+def short_code(index):
+    """Base-36 code for a variable position (lower case, never clashes with upper-cased names)"""
+    code = CODE_ALPHABET[index % 36]
+    index //= 36
+    while index:
+        index -= 1
+        code = CODE_ALPHABET[index % 36] + code
+        index //= 36
+    return code
+
+class PayloadDictionary:
+    """
+    Mapping between full variable names and short payload keys for one level.
+    The stored form is {"keys": {code: name}, "template": {name: default or null}};
+    decoding is template || payload-with-names, which restores every variable.
+    """
+
+    def __init__(self, keys=None, template=None):
+        self.keys = dict(keys or {})
+        self.template = dict(template or {})
+        self.codes = {name: code for code, name in self.keys.items()}
+
+    @classmethod
+    def from_schema(cls, variable_schema, default_value=None, existing=None):
+        """
+        Build a dictionary for a level's variable_schema.
+        Codes already assigned in an existing dictionary are kept stable.
+        """
+        dictionary = existing if existing is not None else cls()
+        for var_def in variable_schema:
+            var_name = var_def['name'].upper()
+            if var_name not in dictionary.codes:
+                code = short_code(len(dictionary.keys))
+                dictionary.keys[code] = var_name
+                dictionary.codes[var_name] = code
+            default = None
+            if default_value is not None and var_def['type'] in NUMERIC_TYPES:
+                default = int(default_value) if var_def['type'] == 'INTEGER' else float(default_value)
+            dictionary.template[var_name] = default
+        return dictionary
+
+    def encode(self, record):
+        """
+        Encode a {name: value} record, dropping defaults and the nulls of
+        variables without a default (nulls of the others are kept explicitly)
+        """
+        template = self.template
+        codes = self.codes
+        encoded = {}
+        for name, value in record.items():
+            default = template.get(name)
+            if value is None:
+                if default is not None:
+                    encoded[codes[name]] = None
+            elif default is None or value != default:
+                encoded[codes[name]] = value
+        return encoded
+
+    def decode(self, payload):
+        """Restore the full {name: value} form of an encoded payload"""
+        record = dict(self.template)
+        for key, value in payload.items():
+            record[self.keys.get(key, key)] = value
+        return record
+
+    def to_json(self):
+        return json.dumps({'keys': self.keys, 'template': self.template})
+
+    @classmethod
+    def from_stored(cls, stored):
+        if not stored:
+            return None
+        if isinstance(stored, str):
+            stored = json.loads(stored)
+        return cls(stored.get('keys'), stored.get('template'))
+
+def ensure_payload_dictionary_support(cur):
+    """Add the dictionary column next to variable_schema and install the SQL decoder"""
+    cur.execute("ALTER TABLE survey_levels ADD COLUMN IF NOT EXISTS payload_dictionary JSONB;")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION decode_survey_payload(p_level_id INTEGER, p_payload JSONB)
+        RETURNS JSONB AS $$
+            SELECT CASE
+                WHEN sl.payload_dictionary IS NULL THEN p_payload
+                ELSE COALESCE(sl.payload_dictionary->'template', '{}'::jsonb) || COALESCE((
+                    SELECT jsonb_object_agg(COALESCE(sl.payload_dictionary->'keys'->>e.key, e.key), e.value)
+                    FROM jsonb_each(p_payload) e
+                ), '{}'::jsonb)
+            END
+            FROM survey_levels sl
+            WHERE sl.level_id = p_level_id;
+        $$ LANGUAGE sql STABLE;
+    """)
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW {DECODED_VIEW} AS
+        SELECT data_id, survey_id, level_id, unit_identifier,
+               decode_survey_payload(level_id, data_payload) AS data_payload
+        FROM survey_data;
+    """)
+
+def load_payload_dictionary(cur, level_id):
+    """Load the stored dictionary of a level (None if the level is not compact-encoded)"""
+    # to_jsonb() also works before ensure_payload_dictionary_support has added the column
+    cur.execute("SELECT to_jsonb(sl)->'payload_dictionary' FROM survey_levels sl WHERE level_id = %s;", (level_id,))
+    result = cur.fetchone()
+    return PayloadDictionary.from_stored(result[0]) if result else None
+
+def payload_relation(cur, level_id=None):
+    """
+    Relation to read full-name payloads from: the decoding view for compact
+    levels (or, without a level, whenever the view exists), else survey_data
+    """
+    if level_id is not None:
+        return DECODED_VIEW if load_payload_dictionary(cur, level_id) is not None else 'survey_data'
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (DECODED_VIEW,))
+    return DECODED_VIEW if cur.fetchone()[0] else 'survey_data'
+
+def save_payload_dictionary(cur, level_id, dictionary):
+    """Store a level's dictionary alongside its variable_schema"""
+    cur.execute(
+        "UPDATE survey_levels SET payload_dictionary = %s::jsonb WHERE level_id = %s;",
+        (dictionary.to_json(), level_id)
+    )
+
+def measure_payload_sizes(csv_path, level_name, max_rows=50000):
+    """
+    Compare bytes per row of the full and compact payloads on a CSV sample.
+    All columns are treated as NUMERIC, which matches block-style microdata.
+    """
+    import pandas as pd
+    from ultra_fast_microdata import process_csv_chunk_optimized
+
+    sample = pd.read_csv(csv_path, dtype=str, nrows=max_rows)
+    variable_schema = [
+        {'name': col, 'type': 'NUMERIC', 'is_common_id': i == 0}
+        for i, col in enumerate(sample.columns)
+    ]
+    dictionary = PayloadDictionary.from_schema(variable_schema, PAYLOAD_DEFAULT_VALUES.get(level_name))
+
+    results = {}
+    for label, payload_dictionary in (('full', None), ('compact', dictionary)):
+        start = time.time()
+        records = process_csv_chunk_optimized(
+            sample.copy(), variable_schema, [variable_schema[0]['name']], 0, 0,
+            payload_dictionary=payload_dictionary
+        )
+        elapsed = time.time() - start
+        total_bytes = sum(len(record[3]) for record in records)
+        results[label] = {
+            'rows': len(records),
+            'bytes_per_row': total_bytes / len(records) if records else 0,
+            'encode_rows_per_sec': len(records) / elapsed if elapsed > 0 else 0
+        }
+        print(f"{label:>8}: {results[label]['bytes_per_row']:.1f} bytes/row, "
+              f"{results[label]['encode_rows_per_sec']:.0f} rows/sec")
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python payload_encoding.py <csv_file> [level_name]")
+        sys.exit(1)
+    measure_payload_sizes(Path(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else 'ASI_BLOCK_G')
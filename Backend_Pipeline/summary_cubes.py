@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Summary Cubes
+Pre-aggregated counts, sums and sums of squares built during microdata ingestion,
+so common tabulations can be answered without scanning survey_data
+"""
+
+import json
+import pandas as pd
+import numpy as np
+from psycopg2.extras import execute_values
+from payload_encoding import payload_relation
+
+# Aggregate table configuration
+SUMMARY_CUBE_TABLE = 'survey_aggregates'
+CUBE_LEVELS_TABLE = 'survey_aggregate_levels'  # Dimensions and measures each level's cube covers
+NUMERIC_TYPES = ('INTEGER', 'NUMERIC')
+
+# Per-level dimension variables. Levels not listed here fall back to the
+# variables flagged with "is_dimension" in their variable_schema, and then to
+# the level's categorical variables (see derive_cube_dimensions).
+CUBE_DIMENSIONS = {
+    # 'ASI_BLOCK_C': ['STATE_CODE', 'NIC_2D'],
+}
+
+# Name fragments of classification codes (state, district, NIC/NCO, sector, ...)
+# that are stored as numbers but tabulated as categories
+DIMENSION_NAME_HINTS = ('STATE', 'DISTRICT', 'NIC', 'NCO', 'NPC', 'SECTOR', 'REGION', 'ITEM')
+MAX_DERIVED_DIMENSIONS = 3  # Bounds the number of cube cells of derived cubes
+
+def derive_cube_dimensions(variable_schema):
+    """
+    Pick dimensions for a level without configuration: non-identifier variables
+    that are text, or whose names look like classification codes
+    """
+    dimensions = []
+    for var_def in variable_schema:
+        var_name = var_def['name'].upper()
+        if var_def['is_common_id']:
+            continue
+        if var_def['type'] not in NUMERIC_TYPES or any(hint in var_name for hint in DIMENSION_NAME_HINTS):
+            dimensions.append(var_name)
+    return dimensions[:MAX_DERIVED_DIMENSIONS]
+
+def get_cube_dimensions(level_name, variable_schema):
+    """Get the dimension variables for a level (config, then schema flags, then derived)"""
+    if level_name in CUBE_DIMENSIONS:
+        return [name.upper() for name in CUBE_DIMENSIONS[level_name]]
+    flagged = [var_def['name'].upper() for var_def in variable_schema if var_def.get('is_dimension')]
+    return flagged or derive_cube_dimensions(variable_schema)
+
+def get_cube_measures(variable_schema, dimensions):
+    """Get the numeric variables that are summarised in the cube"""
+    return [
+        var_def['name'].upper()
+        for var_def in variable_schema
+        if var_def['type'] in NUMERIC_TYPES
+        and not var_def['is_common_id']
+        and var_def['name'].upper() not in dimensions
+    ]
+
+def _json_scalar(value):
+    """Convert a cube key value into something json.dumps accepts"""
+    return None if pd.isna(value) else str(value)
+
+class SummaryCube:
+    """
+    Additive summary cube keyed by dimension values.
+    Every cell holds the record count plus, for each measure, the number of
+    non-null values, their sum, their sum of squares and the largest single
+    value (used by dominance suppression). All of these are additive or
+    max-mergeable, so cubes built per chunk (or per worker) can be merged freely.
+    """
+
+    def __init__(self, dimensions, measures):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.cells = None
+
+    @classmethod
+    def for_level(cls, level_name, variable_schema):
+        """Build an empty cube using the configured dimensions of a level"""
+        dimensions = get_cube_dimensions(level_name, variable_schema)
+        return cls(dimensions, get_cube_measures(variable_schema, dimensions))
+
+    @property
+    def enabled(self):
+        return bool(self.dimensions)
+
+    def _aggregations(self):
+        aggregations = {'cell_count': 'sum'}
+        for measure in self.measures:
+            aggregations[f'{measure}__n'] = 'sum'
+            aggregations[f'{measure}__sum'] = 'sum'
+            aggregations[f'{measure}__sumsq'] = 'sum'
+            aggregations[f'{measure}__max'] = 'max'
+        return aggregations
+
+    def update(self, records_df):
+        """Aggregate a DataFrame of processed records into the cube (vectorized)"""
+        if not self.enabled or records_df.empty:
+            return
+
+        frame = pd.DataFrame(index=records_df.index)
+        for dim in self.dimensions:
+            # Dimension values are kept as text so integer codes survive missing values
+            frame[dim] = records_df[dim].map(lambda v: None if pd.isna(v) else str(v)) \
+                if dim in records_df else None
+        frame['cell_count'] = 1
+        for measure in self.measures:
+            values = pd.to_numeric(records_df.get(measure), errors='coerce') \
+                if measure in records_df else pd.Series(np.nan, index=records_df.index)
+            frame[f'{measure}__n'] = values.notna().astype(np.int64)
+            frame[f'{measure}__sum'] = values.fillna(0.0)
+            frame[f'{measure}__sumsq'] = values.fillna(0.0) ** 2
+            frame[f'{measure}__max'] = values
+
+        chunk_cells = frame.groupby(self.dimensions, dropna=False, sort=False).agg(self._aggregations())
+        self._add_cells(chunk_cells)
+
+    def merge(self, other):
+        """Merge another cube with the same dimensions and measures into this one"""
+        if other.dimensions != self.dimensions or other.measures != self.measures:
+            raise ValueError("Cannot merge summary cubes with different dimensions or measures")
+        if other.cells is not None:
+            self._add_cells(other.cells)
+        return self
+
+    def _add_cells(self, cells):
+        if self.cells is None:
+            self.cells = cells
+        else:
+            combined = pd.concat([self.cells, cells])
+            self.cells = combined.groupby(
+                level=list(range(len(self.dimensions))), dropna=False, sort=False
+            ).agg(self._aggregations())
+
+    def to_rows(self, survey_id, level_id):
+        """Flatten the cube into rows for the aggregate table"""
+        if self.cells is None:
+            return []
+
+        rows = []
+        for key, cell in zip(self.cells.index, self.cells.itertuples(index=False)):
+            if len(self.dimensions) == 1:
+                key = (key,)
+            dimension_values = json.dumps({
+                dim: _json_scalar(value) for dim, value in zip(self.dimensions, key)
+            }, sort_keys=True)
+            cell_count = int(cell[0])
+            # The '' row carries the plain record count for count-only tabulations
+            rows.append((survey_id, level_id, dimension_values, '', cell_count, 0, 0.0, 0.0, None))
+            for i, measure in enumerate(self.measures):
+                offset = 1 + i * 4
+                value_max = cell[offset + 3]
+                rows.append((
+                    survey_id,
+                    level_id,
+                    dimension_values,
+                    measure,
+                    cell_count,
+                    int(cell[offset]),
+                    float(cell[offset + 1]),
+                    float(cell[offset + 2]),
+                    None if pd.isna(value_max) else float(value_max)
+                ))
+        return rows
+
+def ensure_summary_cube_table(cur):
+    """Create the aggregate table if it does not exist"""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SUMMARY_CUBE_TABLE} (
+            survey_id INTEGER NOT NULL,
+            level_id INTEGER NOT NULL,
+            dimension_values JSONB NOT NULL,
+            variable_name TEXT NOT NULL,
+            cell_count BIGINT NOT NULL,
+            value_count BIGINT NOT NULL,
+            value_sum DOUBLE PRECISION NOT NULL,
+            value_sum_sq DOUBLE PRECISION NOT NULL,
+            value_max DOUBLE PRECISION,
+            PRIMARY KEY (survey_id, level_id, variable_name, dimension_values)
+        );
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CUBE_LEVELS_TABLE} (
+            survey_id INTEGER NOT NULL,
+            level_id INTEGER NOT NULL,
+            dimensions TEXT[] NOT NULL,
+            measures TEXT[] NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (survey_id, level_id)
+        );
+    """)
+
+def rebuild_summary_cube(cur, survey_id, level_id, dimensions, measures):
+    """
+    Recompute a level's cube from survey_data in one scan (backfill of rows loaded
+    earlier). Dimension values are the payload text and measures only count JSON
+    numbers, matching what SummaryCube.update() aggregates during ingestion.
+    """
+    cur.execute(f"DELETE FROM {SUMMARY_CUBE_TABLE} WHERE survey_id = %s AND level_id = %s;", (survey_id, level_id))
+    cur.execute(f"DELETE FROM {CUBE_LEVELS_TABLE} WHERE survey_id = %s AND level_id = %s;", (survey_id, level_id))
+
+    dimension_pairs = ", ".join("%s::text, d.data_payload->>%s" for _ in dimensions)
+    dimension_params = [value for dim in dimensions for value in (dim, dim)]
+    # Every row contributes once per measure plus once to the '' count row
+    cur.execute(f"""
+        INSERT INTO {SUMMARY_CUBE_TABLE}
+            (survey_id, level_id, dimension_values, variable_name,
+             cell_count, value_count, value_sum, value_sum_sq, value_max)
+        SELECT %s, %s, c.dimension_values, c.variable_name,
+               COUNT(*), COUNT(c.value), COALESCE(SUM(c.value), 0),
+               COALESCE(SUM(c.value * c.value), 0), MAX(c.value)
+        FROM (
+            SELECT jsonb_build_object({dimension_pairs}) AS dimension_values, m.variable_name,
+                   CASE WHEN jsonb_typeof(d.data_payload->m.variable_name) = 'number'
+                        THEN (d.data_payload->>m.variable_name)::double precision END AS value
+            FROM {payload_relation(cur, level_id)} d
+            CROSS JOIN unnest(%s::text[] || ARRAY['']) AS m(variable_name)
+            WHERE d.survey_id = %s AND d.level_id = %s
+        ) c
+        GROUP BY c.dimension_values, c.variable_name;
+    """, [survey_id, level_id] + dimension_params + [list(measures), survey_id, level_id])
+
+    cur.execute(f"""
+        INSERT INTO {CUBE_LEVELS_TABLE} (survey_id, level_id, dimensions, measures, updated_at)
+        VALUES (%s, %s, %s::text[], %s::text[], now());
+    """, (survey_id, level_id, list(dimensions), list(measures)))
+
+def backfill_summary_cube(cur, survey_id, level_id, cube):
+    """
+    Rebuild a level's cube before rows are added to it, when it has none yet or
+    was built with other dimensions or measures. Afterwards the cube covers every
+    row of the level and can be accumulated into. Returns True if rebuilt.
+    """
+    cur.execute(f"""
+        SELECT dimensions, measures FROM {CUBE_LEVELS_TABLE}
+        WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id))
+    result = cur.fetchone()
+    if result and list(result[0]) == cube.dimensions and list(result[1]) == cube.measures:
+        return False
+    rebuild_summary_cube(cur, survey_id, level_id, cube.dimensions, cube.measures)
+    return True
+
+def write_summary_cube(cur, cube, survey_id, level_id, batch_size=10000):
+    """
+    Write a level's cube to the aggregate table.
+    Existing cells are accumulated into, matching the append-only survey_data loads.
+    """
+    rows = cube.to_rows(survey_id, level_id)
+    if not rows:
+        return 0
+
+    query = f"""
+        INSERT INTO {SUMMARY_CUBE_TABLE}
+            (survey_id, level_id, dimension_values, variable_name,
+             cell_count, value_count, value_sum, value_sum_sq, value_max)
+        VALUES %s
+        ON CONFLICT (survey_id, level_id, variable_name, dimension_values) DO UPDATE SET
+            cell_count = {SUMMARY_CUBE_TABLE}.cell_count + EXCLUDED.cell_count,
+            value_count = {SUMMARY_CUBE_TABLE}.value_count + EXCLUDED.value_count,
+            value_sum = {SUMMARY_CUBE_TABLE}.value_sum + EXCLUDED.value_sum,
+            value_sum_sq = {SUMMARY_CUBE_TABLE}.value_sum_sq + EXCLUDED.value_sum_sq,
+            value_max = GREATEST({SUMMARY_CUBE_TABLE}.value_max, EXCLUDED.value_max);
+    """
+    execute_values(cur, query, rows, template="(%s, %s, %s::jsonb, %s, %s, %s, %s, %s, %s)", page_size=batch_size)
+    return len(rows)
+
+def fetch_tabulation(cur, survey_id, level_id, group_by, variable_name='', filters=None):
+    """
+    Answer a tabulation from the aggregate table without touching survey_data.
+    Returns a DataFrame with count, sum, largest value, mean and standard deviation per group.
+    Raises ValueError when the level has no complete cube over the requested variables.
+    """
+    group_by = [dim.upper() for dim in group_by]
+    filters = {key.upper(): str(value) for key, value in (filters or {}).items()}
+
+    cur.execute(f"""
+        SELECT dimensions, measures FROM {CUBE_LEVELS_TABLE}
+        WHERE survey_id = %s AND level_id = %s;
+    """, (survey_id, level_id))
+    coverage = cur.fetchone()
+    if not coverage:
+        raise ValueError(f"No complete summary cube for survey {survey_id} level {level_id}")
+    missing = [dim for dim in group_by + list(filters) if dim not in coverage[0]]
+    if missing or (variable_name and variable_name.upper() not in coverage[1]):
+        raise ValueError(f"Summary cube of level {level_id} does not cover {missing or variable_name.upper()}")
+
+    select_dims = ", ".join(f"dimension_values->>%s AS \"{dim}\"" for dim in group_by)
+    where = ["survey_id = %s", "level_id = %s", "variable_name = %s"]
+    params = list(group_by) + [survey_id, level_id, variable_name.upper()]
+    if filters:
+        where.append("dimension_values @> %s::jsonb")
+        params.append(json.dumps(filters))
+    group_clause = f"GROUP BY {', '.join(str(i + 1) for i in range(len(group_by)))}" if group_by else ""
+
+    cur.execute(f"""
+        SELECT {select_dims + ',' if select_dims else ''}
+               SUM(cell_count) AS cell_count,
+               SUM(value_count) AS value_count,
+               SUM(value_sum) AS value_sum,
+               SUM(value_sum_sq) AS value_sum_sq,
+               MAX(value_max) AS value_max
+        FROM {SUMMARY_CUBE_TABLE}
+        WHERE {' AND '.join(where)}
+        {group_clause};
+    """, params)
+
+    stat_columns = ['cell_count', 'value_count', 'value_sum', 'value_sum_sq', 'value_max']
+    table = pd.DataFrame(cur.fetchall(), columns=group_by + stat_columns)
+    for column in stat_columns:
+        table[column] = pd.to_numeric(table[column])
+
+    n = table['value_count'].where(table['value_count'] > 0)
+    table['mean'] = table['value_sum'] / n
+    variance = (table['value_sum_sq'] - n * table['mean'] ** 2) / (n - 1)
+    table['std'] = np.sqrt(variance.clip(lower=0))
+    return table
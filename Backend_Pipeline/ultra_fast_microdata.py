@@ -14,12 +14,22 @@ import io
 import time
 from pathlib import Path
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from data_validation import ChunkValidator
+from compressed_input import find_input_files, iter_input_chunks
+from summary_cubes import SummaryCube, backfill_summary_cube, ensure_summary_cube_table, write_summary_cube
+from level_stats import LevelStats, backfill_level_stats, ensure_level_stats_tables, write_level_stats
+from linkage_index import ensure_linkage_tables, link_new_rows
+from payload_encoding import (
+    PayloadDictionary, PAYLOAD_DEFAULT_VALUES, ensure_payload_dictionary_support,
+    load_payload_dictionary, save_payload_dictionary
+)
 
 # Database Configuration
-DB_HOST = "localhost"
-DB_NAME = "statathon" 
-DB_USER = "postgres" 
-DB_PASSWORD = "Suraj@#6708"
+DB_HOST = os.environ.get('DB_HOST', "localhost")
+DB_NAME = os.environ.get('DB_NAME', "statathon")
+DB_USER = os.environ.get('DB_USER', "postgres")
+DB_PASSWORD = os.environ.get('DB_PASSWORD', "Suraj@#6708")
 
 # Performance Configuration
 BATCH_SIZE = 25000  # Optimized batch size for better memory management
@@ -28,6 +38,11 @@ USE_BULK_INSERT = True  # Use bulk INSERT statements
 USE_TRANSACTION_BATCHING = True  # Batch transactions for better performance
 CHUNK_SIZE = 50000  # Process CSV in manageable chunks
 RETRY_ATTEMPTS = 3  # Number of retry attempts for failed operations
+BUILD_SUMMARY_CUBES = True  # Build pre-aggregated summary cubes while ingesting
+TRACK_LEVEL_STATS = True  # Maintain exact row counts and filter value counts per level
+BUILD_LINKAGE_INDEX = True  # Map unit identifiers to integer keys for cross-level joins
+VALIDATE_DATA = True  # Run data-quality checks alongside the transform (reports in validation_reports/)
+USE_COMPACT_PAYLOAD = False  # Short-key payloads without nulls/defaults (decode via survey_data_decoded)
 
 # CSV Configuration
 MICRODATA_CSV_DIR = '../Data_Injection/hces_microdata_csvs'
@@ -108,11 +123,18 @@ def bulk_insert_with_execute_values(cur, data_records, batch_size=50000):
         print(f"Bulk insert error: {e}")
         return False
 
-def process_csv_chunk_optimized(chunk_df, variable_schema, common_identifiers, asi_survey_id, level_id):
+def process_csv_chunk_optimized(chunk_df, variable_schema, common_identifiers, asi_survey_id, level_id, cube=None,
+                                payload_dictionary=None, stats=None):
     """
     Optimized chunk processing using vectorized operations.
+    If a SummaryCube is given, the kept records are aggregated into it.
+    If a PayloadDictionary is given, payloads are written in compact form.
+    If a LevelStats is given, row and filter value counts are added to it.
     """
     processed_records = []
+    kept_rows = []
+    # Records are only collected into a DataFrame when something aggregates their values
+    keep_rows = cube is not None or (stats is not None and bool(stats.filter_variables))
     
     # Convert column names to uppercase once
     chunk_df.columns = [col.upper() for col in chunk_df.columns]
@@ -150,21 +172,67 @@ def process_csv_chunk_optimized(chunk_df, variable_schema, common_identifiers, a
         # Check if we have all required common identifiers
         if len(unit_id_parts) == len(common_identifiers) and all(p != '' for p in unit_id_parts):
             unit_identifier = "_".join(unit_id_parts)
+            if payload_dictionary is not None:
+                data_payload = json.dumps(payload_dictionary.encode(current_record_data), separators=(',', ':'))
+            else:
+                data_payload = json.dumps(current_record_data)
             processed_records.append((
                 asi_survey_id, 
                 level_id, 
                 unit_identifier, 
-                json.dumps(current_record_data)
+                data_payload
             ))
+            if keep_rows:
+                kept_rows.append(current_record_data)
+    
+    if kept_rows:
+        kept_df = pd.DataFrame(kept_rows, dtype=object)
+        if cube is not None:
+            cube.update(kept_df)
+        if stats is not None and stats.filter_variables:
+            stats.update(kept_df)
+    if stats is not None and not stats.filter_variables:
+        stats.count_rows(len(processed_records))
     
     return processed_records
 
+def flush_summary_cube(cur, cube, survey_id, level_id):
+    """
+    Write the pending cube cells in the current transaction and return a fresh cube,
+    so aggregates are committed together with the rows they summarise.
+    """
+    if cube is None or cube.cells is None:
+        return cube
+    
+    cell_rows = write_summary_cube(cur, cube, survey_id, level_id)
+    print(f"      Updated {cell_rows:,} summary cube rows")
+    return SummaryCube(cube.dimensions, cube.measures)
+
+def report_validation(validator, futures, file_time):
+    """Wait for a file's validation to finish, then print and save its report"""
+    try:
+        for future in futures:
+            future.result()
+    except Exception as e:
+        print(f"      Validation error: {e}")
+        return
+    
+    report_path = validator.write_report()
+    summary = validator.summary()
+    overhead = (summary['validation_seconds'] / file_time * 100) if file_time > 0 else 0
+    print(f"      Validation: {summary['rows_with_errors']:,} of {summary['rows_checked']:,} rows with errors "
+          f"({summary['validation_seconds']:.2f}s, {overhead:.1f}% of file time) -> {report_path}")
+    for column, checks in summary['error_counts'].items():
+        details = ", ".join(f"{check}: {count:,}" for check, count in checks.items())
+        print(f"         {column}: {details}")
+
 def ingest_microdata_ultra_fast():
     """
     Ultra-fast microdata ingestion using the fastest possible methods.
     """
     conn = None
     cur = None
+    validation_executor = None
     start_time = time.time()
     
     try:
@@ -175,6 +243,11 @@ def ingest_microdata_ultra_fast():
         print(f"   - Use COPY Command: {USE_COPY_COMMAND}")
         print(f"   - Use Bulk Insert: {USE_BULK_INSERT}")
         print(f"   - Transaction Batching: {USE_TRANSACTION_BATCHING}")
+        print(f"   - Summary Cubes: {BUILD_SUMMARY_CUBES}")
+        print(f"   - Level Stats: {TRACK_LEVEL_STATS}")
+        print(f"   - Linkage Index: {BUILD_LINKAGE_INDEX}")
+        print(f"   - Data Validation: {VALIDATE_DATA}")
+        print(f"   - Compact Payload: {USE_COMPACT_PAYLOAD}")
         print()
         
         # Get database connection
@@ -209,25 +282,54 @@ def ingest_microdata_ultra_fast():
         
         print(f"Loaded metadata for {len(all_level_metadata)} levels")
         
+        if BUILD_SUMMARY_CUBES:
+            ensure_summary_cube_table(cur)
+            conn.commit()
+        
+        if TRACK_LEVEL_STATS:
+            ensure_level_stats_tables(cur)
+            conn.commit()
+        
+        if BUILD_LINKAGE_INDEX:
+            ensure_linkage_tables(cur)
+            conn.commit()
+        
+        if USE_COMPACT_PAYLOAD:
+            ensure_payload_dictionary_support(cur)
+            conn.commit()
+        
         # Check CSV directory
         csv_dir = Path(MICRODATA_CSV_DIR)
         if not csv_dir.exists():
             print(f"CSV directory not found: {csv_dir}")
             sys.exit(1)
         
-        csv_files = list(csv_dir.glob('*.csv'))
+        # Plain and compressed (.gz/.zip/.zst) files are read as streams, never unpacked to disk
+        csv_files = find_input_files(csv_dir)
         if not csv_files:
             print("No CSV files found")
             sys.exit(1)
         
         print(f"Found {len(csv_files)} CSV files")
         
+        # Read CSV in chunks for memory efficiency; archive members are decoded in parallel
+        csv_sources = iter_input_chunks(csv_files, {
+            'header': None,
+            'dtype': str,
+            'chunksize': CHUNK_SIZE,
+            'engine': 'c'  # Use C engine for better performance
+        })
+        
         total_inserted = 0
         total_processed = 0
         
-        for csv_file in csv_files:
+        if VALIDATE_DATA:
+            # One worker keeps chunks in order for duplicate detection while overlapping the transform and COPY
+            validation_executor = ThreadPoolExecutor(max_workers=1)
+        
+        for source_name, chunk_iter in csv_sources:
             file_start_time = time.time()
-            print(f"\nProcessing: {csv_file.name}")
+            print(f"\nProcessing: {source_name}")
             
             # Determine database level mapping
             db_level_name = 'ASI_BLOCK_C'  # Default mapping
@@ -242,19 +344,47 @@ def ingest_microdata_ultra_fast():
             
             print(f"   -> Mapping to DB Level: {db_level_name} (ID: {level_id})")
             
-            try:
-                # Read CSV in chunks for memory efficiency
-                chunk_iter = pd.read_csv(
-                    csv_file, 
-                    header=None, 
-                    dtype=str, 
-                    chunksize=CHUNK_SIZE,
-                    engine='c'  # Use C engine for better performance
+            payload_dictionary = None
+            if USE_COMPACT_PAYLOAD:
+                # Reuse stored codes so every file of a level shares one dictionary
+                payload_dictionary = PayloadDictionary.from_schema(
+                    variable_schema,
+                    PAYLOAD_DEFAULT_VALUES.get(db_level_name),
+                    load_payload_dictionary(cur, level_id)
                 )
-                
+                save_payload_dictionary(cur, level_id, payload_dictionary)
+                conn.commit()
+                print(f"   -> Compact payload dictionary: {len(payload_dictionary.keys)} keys")
+            
+            # Counts not yet written; flushed together with each data commit
+            pending_stats = None
+            if TRACK_LEVEL_STATS:
+                pending_stats = LevelStats.for_level(db_level_name, variable_schema)
+                # Count the rows already in the level once, so the stored totals are complete
+                if backfill_level_stats(cur, asi_survey_id, level_id, pending_stats.filter_variables):
+                    print(f"   -> Backfilled level statistics for {db_level_name}")
+                conn.commit()
+            
+            # Cube cells not yet written; flushed together with each data commit
+            pending_cube = None
+            if BUILD_SUMMARY_CUBES:
+                pending_cube = SummaryCube.for_level(db_level_name, variable_schema)
+                if pending_cube.enabled:
+                    print(f"   -> Summary cube dimensions: {', '.join(pending_cube.dimensions)}")
+                    # Aggregate the rows already in the level once, so the cube is complete
+                    if backfill_summary_cube(cur, asi_survey_id, level_id, pending_cube):
+                        print(f"   -> Rebuilt summary cube for {db_level_name}")
+                    conn.commit()
+                else:
+                    print(f"   -> No cube dimensions configured for {db_level_name}, skipping summary cube")
+                    pending_cube = None
+            
+            try:
                 file_records = 0
                 file_inserted = 0
                 chunk_count = 0
+                validator = ChunkValidator(variable_schema, db_level_name, source_name) if VALIDATE_DATA else None
+                validation_futures = []
                 
                 for chunk in chunk_iter:
                     chunk_count += 1
@@ -262,9 +392,21 @@ def ingest_microdata_ultra_fast():
                     
                     print(f"   Processing chunk {chunk_count} ({len(chunk):,} records)...")
                     
+                    if validator is not None:
+                        # Hand the validator its own column references before the transform renames them
+                        raw_columns = {str(col).upper(): chunk[col] for col in chunk.columns}
+                        validation_futures.append(
+                            validation_executor.submit(validator.validate, raw_columns, file_records)
+                        )
+                    
                     # Process chunk
+                    chunk_cube = None
+                    if pending_cube is not None:
+                        chunk_cube = SummaryCube(pending_cube.dimensions, pending_cube.measures)
+                    chunk_stats = LevelStats(pending_stats.filter_variables) if pending_stats is not None else None
                     processed_records = process_csv_chunk_optimized(
-                        chunk, variable_schema, common_identifiers, asi_survey_id, level_id
+                        chunk, variable_schema, common_identifiers, asi_survey_id, level_id, chunk_cube,
+                        payload_dictionary, chunk_stats
                     )
                     
                     if processed_records:
@@ -280,13 +422,24 @@ def ingest_microdata_ultra_fast():
                             file_inserted += len(processed_records)
                             total_inserted += len(processed_records)
                             
+                            if chunk_cube is not None:
+                                pending_cube.merge(chunk_cube)
+                            if chunk_stats is not None:
+                                pending_stats.merge(chunk_stats)
+                            
                             # Commit in batches for better performance
                             if USE_TRANSACTION_BATCHING and chunk_count % 5 == 0:
+                                pending_cube = flush_summary_cube(cur, pending_cube, asi_survey_id, level_id)
+                                if pending_stats is not None:
+                                    write_level_stats(cur, pending_stats, asi_survey_id, level_id)
+                                if BUILD_LINKAGE_INDEX:
+                                    link_new_rows(cur, asi_survey_id, level_id)
                                 conn.commit()
                             
                             chunk_time = time.time() - chunk_start
                             speed = len(processed_records) / chunk_time if chunk_time > 0 else 0
-                            print(f"      Inserted {len(processed_records):,} records in {chunk_time:.2f}s ({speed:.0f} records/sec)")
+                            payload_bytes = sum(len(record[3]) for record in processed_records) / len(processed_records)
+                            print(f"      Inserted {len(processed_records):,} records in {chunk_time:.2f}s ({speed:.0f} records/sec, {payload_bytes:.0f} payload bytes/row)")
                         else:
                             print(f"      Failed to insert chunk {chunk_count}")
                             conn.rollback()
@@ -296,14 +449,23 @@ def ingest_microdata_ultra_fast():
                     total_processed += len(chunk)
                 
                 # Final commit for this file
+                pending_cube = flush_summary_cube(cur, pending_cube, asi_survey_id, level_id)
+                if pending_stats is not None:
+                    write_level_stats(cur, pending_stats, asi_survey_id, level_id)
+                if BUILD_LINKAGE_INDEX:
+                    linked = link_new_rows(cur, asi_survey_id, level_id)
+                    print(f"      Linked {linked:,} rows to unit keys")
                 conn.commit()
                 
                 file_time = time.time() - file_start_time
                 print(f"   File completed in {file_time:.2f}s")
                 print(f"      Total: {file_records:,}, Inserted: {file_inserted:,}")
                 
+                if validator is not None:
+                    report_validation(validator, validation_futures, file_time)
+                
             except Exception as e:
-                print(f"   Error processing {csv_file.name}: {e}")
+                print(f"   Error processing {source_name}: {e}")
                 conn.rollback()
                 continue
         
@@ -327,6 +489,8 @@ def ingest_microdata_ultra_fast():
             conn.rollback()
         sys.exit(1)
     finally:
+        if validation_executor:
+            validation_executor.shutdown(wait=True)
         if cur:
             cur.close()
         if conn: